@@ -8,24 +8,71 @@ bl_info = {
     "category": "Import-Export",
 }
 
+import math
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
 import bpy
-import sys
-import glob
 from .o3d_types import *
-from .importer import O3DFile
+from .importer import O3DFile, find_skeleton, count_parsed, PROCESS_WORKERS
+from .exporter import O3DWriter
+from . import profiling
 from .blender_control import *
-from bpy.types import Operator
+from bpy.types import Operator, OperatorFileListElement
 from bpy_extras.io_utils import ImportHelper, ExportHelper, poll_file_object_drop
-from bpy.props import (StringProperty, BoolProperty, EnumProperty)
+from bpy.props import (StringProperty, BoolProperty, FloatProperty, CollectionProperty)
 
 
-class ImportO3D(Operator, ImportHelper):
+# Keyframe reduction error bounds, in Blender units and radians
+DEFAULT_POSITION_TOLERANCE = 0.001
+DEFAULT_ANGLE_TOLERANCE = math.radians(0.1)
+
+
+class KeyframeReductionProperties:
+    """Keyframe reduction options shared by the model and animation importers."""
+    reduce_keyframes: BoolProperty(
+        name="Reduce Keyframes",
+        description=(
+            "Drop animation keys that linear interpolation between the remaining keys reproduces within the tolerances"
+        ),
+        default=False
+    )
+
+    position_tolerance: FloatProperty(
+        name="Position Tolerance",
+        description=(
+            "Largest distance a bone may deviate from its original position when keys are reduced"
+        ),
+        default=DEFAULT_POSITION_TOLERANCE,
+        min=0.0,
+        precision=4,
+        subtype='DISTANCE'
+    )
+
+    angle_tolerance: FloatProperty(
+        name="Angle Tolerance",
+        description=(
+            "Largest angle a bone may deviate from its original rotation when keys are reduced"
+        ),
+        default=DEFAULT_ANGLE_TOLERANCE,
+        min=0.0,
+        subtype='ANGLE'
+    )
+
+
+class ImportO3D(Operator, ImportHelper, KeyframeReductionProperties):
     """Import a Fly For Fun O3D model."""
     bl_idname = "import_scene.o3d"
     bl_label = "Import O3D Model"
 
     filename_ext = ".o3d"
 
+    # Seconds of scene building per timer event of a background import
+    time_slice = 0.02
+    _task : "ImportTask" = None
+    _timer = None
+
     filter_glob: StringProperty(
         default="*.o3d",
         options={'HIDDEN'},
@@ -56,38 +103,331 @@ class ImportO3D(Operator, ImportHelper):
         default=True
     )
 
+    parallel: BoolProperty(
+        name="Parallel Parsing",
+        description=(
+            "Parse the model, skeleton and animation files concurrently in worker processes. "
+            "Only available on Linux, elsewhere the files are parsed one after another"
+        ),
+        default=False
+    )
+
+    columnar: BoolProperty(
+        name="Columnar Geometry",
+        description=(
+            "Decode geometry straight into NumPy arrays instead of lists of tuples, much faster for large models"
+        ),
+        default=False
+    )
+
+    use_mmap: BoolProperty(
+        name="Memory-Mapped Reading",
+        description=(
+            "Read the model, skeleton and animation files through a memory map instead of buffered reads"
+        ),
+        default=False
+    )
+
+    use_cache: BoolProperty(
+        name="Cache Skeletons and Animations",
+        description=(
+            "Reuse skeletons and animations parsed by earlier imports while their files are unchanged"
+        ),
+        default=True
+    )
+
+    use_sidecar: BoolProperty(
+        name="Sidecar Cache Files",
+        description=(
+            "Store parsed models and skeletons in .cache files next to them and load those while they are up to date"
+        ),
+        default=False
+    )
+
+    lazy: BoolProperty(
+        name="Skip Hidden Geometry",
+        description=(
+            "Do not read or create the level of detail and collision meshes that would be hidden. "
+            "Object > Load Skipped O3D Geometry builds them later"
+        ),
+        default=False
+    )
+
+    instance_meshes: BoolProperty(
+        name="Instance Repeated Meshes",
+        description=(
+            "Share one mesh between unskinned objects with identical geometry and materials, "
+            "including meshes of earlier imports"
+        ),
+        default=False
+    )
+
+    merge_static: BoolProperty(
+        name="Merge Static Meshes",
+        description=(
+            "Join the unskinned, unanimated objects of each level of detail that share a parent "
+            "into one mesh with their transforms applied"
+        ),
+        default=False
+    )
+
+    use_modal: BoolProperty(
+        name="Import in Background",
+        description=(
+            "Parse in the background and build the scene in small steps, keeping Blender responsive. "
+            "Press Esc to cancel. Only imports started from the interface run in the background"
+        ),
+        default=True
+    )
+
+    # Set by invoke. Operators called from scripts only execute and expect the scene to
+    # exist when they return, so those never go modal
+    from_interface: BoolProperty(
+        default=False,
+        options={'HIDDEN', 'SKIP_SAVE'}
+    )
+
+    profile: BoolProperty(
+        name="Profile Import",
+        description=(
+            "Time every import stage and write the timings and counts as a JSON report"
+        ),
+        default=False
+    )
+
+    use_cprofile: BoolProperty(
+        name="Capture cProfile",
+        description=(
+            "Also run the import under cProfile and add the slowest functions to the report"
+        ),
+        default=False
+    )
+
+    profile_path: StringProperty(
+        name="Profile Report",
+        description=(
+            "JSON file the profile is written to, o3d_import_profile.json in the temporary directory if empty"
+        ),
+        subtype='FILE_PATH',
+        default=""
+    )
+
+
+    def invoke(self, context, event):
+        self.from_interface = True
+        return super().invoke(context, event)
+
 
     def execute(self, context):
-        o3d_file = O3DFile(self.filepath)
-        o3d_file.read_o3d(self.as_keywords())
-
-        separator = "\\" if sys.platform == "win32" else "/"
-
-        filename = self.filepath.split(separator)[-1]
-        skel_name : str = ""
-        if filename.lower().startswith("mvr"):
-            skel_name = self.filepath
-            last_index = skel_name.rfind(".")
-            skel_name = skel_name[:last_index] + ".chr"
-            o3d_file.read_chr(skel_name)
-        elif filename.lower().startswith("part"):
-            pass
-
-        if len(skel_name) > 0 and o3d_file.import_settings["include_animations"]:
-            ani_files = glob.glob(skel_name[:skel_name.rfind(".")] + "_*.ani")
-            for ani in ani_files:
-                o3d_file.read_ani(ani)
-        
-        create_scene(o3d_file)
+        profile = profiling.ImportProfile(self.filepath, self.use_cprofile) if self.profile else None
+        o3d_file = O3DFile(self.filepath, self.use_mmap, self.columnar, use_cache=self.use_cache,
+                           use_sidecar=self.use_sidecar, lazy=self.lazy)
+        self._task = ImportTask(o3d_file, self.as_keywords(), self.parallel and PROCESS_WORKERS, profile)
+
+        # Scripts and background runs expect the scene to exist when the operator returns
+        if not (self.use_modal and self.from_interface) or bpy.app.background or context.window is None:
+            self._task.read_model()
+            with profile or nullcontext():
+                create_scene(o3d_file)
+            return self.finish()
+
+        self._task.start()
+        wm = context.window_manager
+        wm.progress_begin(0, 1)
+        self._timer = wm.event_timer_add(0.01, window=context.window)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+
+    def modal(self, context, event):
+        if event.type == 'ESC' and event.value == 'PRESS':
+            self._task.cancel()
+            self.end_modal(context)
+            self.report({'WARNING'}, "Import cancelled")
+            return {'CANCELLED'}
+
+        # Once scene steps run, undo or edits between them would invalidate the data they keep
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'} if self._task.steps is None else {'RUNNING_MODAL'}
+
+        try:
+            complete = self._task.step(self.time_slice)
+        except Exception as e:
+            self._task.cancel()
+            self.end_modal(context)
+            self.report({'ERROR'}, f"Import failed: {type(e).__name__}: {e}")
+            return {'CANCELLED'}
+
+        if self._task.step_count > 0:
+            context.window_manager.progress_update(self._task.done / self._task.step_count)
+        if not complete:
+            return {'PASS_THROUGH'}
+
+        self.end_modal(context)
+        return self.finish()
+
+
+    def cancel(self, context):
+        self._task.cancel()
+        self.end_modal(context)
+
+
+    def end_modal(self, context):
+        wm = context.window_manager
+        wm.event_timer_remove(self._timer)
+        wm.progress_end()
+
+
+    def finish(self):
+        profile = self._task.profile
+        if profile is not None:
+            report_path = bpy.path.abspath(self.profile_path) or os.path.join(bpy.app.tempdir, "o3d_import_profile.json")
+            profile.write(report_path)
+            print(profile.summary())
+            self.report({'INFO'}, f"Import profile written to {report_path}")
+
         print("Done.")
         return {'FINISHED'}
 
 
+class ExportO3D(Operator, ExportHelper):
+    """Export a Fly For Fun O3D model."""
+    bl_idname = "export_scene.o3d"
+    bl_label = "Export O3D Model"
+
+    filename_ext = ".o3d"
+
+    filter_glob: StringProperty(
+        default="*.o3d",
+        options={'HIDDEN'},
+        maxlen=255  # Max internal buffer length, longer would be clamped.
+    )
+
+    use_selection: BoolProperty(
+        name="Selected Only",
+        description=(
+            "Export only the selected meshes instead of all meshes in the scene"
+        ),
+        default=False
+    )
+
+
+    def execute(self, context):
+        objects = context.selected_objects if self.use_selection else context.scene.objects
+
+        # Bone ids have to match the skeleton the client loads with the model
+        bone_names = None
+        skel_name = find_skeleton(self.filepath)
+        if os.path.exists(skel_name):
+            bone_names = [bone.name for bone in O3DFile(skel_name).parse_chr(skel_name).bones]
+
+        try:
+            o3d, gmobjects = gather_o3d(objects, bone_names)
+        except ValueError as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+
+        if len(gmobjects) == 0:
+            self.report({'ERROR'}, "No meshes to export")
+            return {'CANCELLED'}
+
+        O3DWriter(self.filepath).write_o3d(o3d, gmobjects)
+        print("Done.")
+        return {'FINISHED'}
+
+
+class ImportANI(Operator, ImportHelper, KeyframeReductionProperties):
+    """Import Fly For Fun .ani animations onto the active armature."""
+    bl_idname = "import_scene.o3d_ani"
+    bl_label = "Import ANI Animations"
+
+    filename_ext = ".ani"
+
+    filter_glob: StringProperty(
+        default="*.ani",
+        options={'HIDDEN'},
+        maxlen=255  # Max internal buffer length, longer would be clamped.
+    )
+
+    files: CollectionProperty(
+        type=OperatorFileListElement,
+        options={'HIDDEN', 'SKIP_SAVE'}
+    )
+
+    directory: StringProperty(
+        subtype='DIR_PATH',
+        options={'HIDDEN', 'SKIP_SAVE'}
+    )
+
+    replace_actions: BoolProperty(
+        name="Replace Existing Actions",
+        description=(
+            "Swap actions with the same name for the imported ones everywhere they are used, "
+            "instead of adding numbered copies"
+        ),
+        default=True
+    )
+
+    use_cache: BoolProperty(
+        name="Cache Animations",
+        description=(
+            "Reuse animations parsed by earlier imports while their files are unchanged"
+        ),
+        default=True
+    )
+
+
+    @classmethod
+    def poll(cls, context):
+        return context.active_object is not None and context.active_object.type == "ARMATURE"
+
+
+    def execute(self, context):
+        filepaths = [os.path.join(self.directory, f.name) for f in self.files if f.name] or [self.filepath]
+        reduction = keyframe_reduction(self.as_keywords())
+        actions = import_animations(context.active_object, filepaths, reduction, self.use_cache, self.replace_actions)
+        if len(actions) == 0:
+            self.report({'ERROR'}, "No supported animations")
+            return {'CANCELLED'}
+
+        self.report({'INFO'}, f"Imported {len(actions)} animations")
+        print("Done.")
+        return {'FINISHED'}
+
+
+class LoadSkippedO3D(Operator):
+    """Load the level of detail and collision meshes a lazy import skipped for the model of the active object."""
+    bl_idname = "object.o3d_load_skipped"
+    bl_label = "Load Skipped O3D Geometry"
+    bl_options = {'REGISTER', 'UNDO'}
+
+
+    @classmethod
+    def poll(cls, context):
+        return context.active_object is not None and SOURCE_PROPERTY in context.active_object
+
+
+    def execute(self, context):
+        source = context.active_object[SOURCE_PROPERTY]
+        if not os.path.exists(source):
+            self.report({'ERROR'}, f"Model file not found: {source}")
+            return {'CANCELLED'}
+
+        try:
+            count = load_skipped(context.scene, source)
+        except OSError as e:
+            self.report({'ERROR'}, f"Could not load the skipped geometry: {e}")
+            return {'CANCELLED'}
+
+        self.report({'INFO'}, f"Loaded {count} skipped meshes")
+        return {'FINISHED'}
+
+
 class IO_FH_O3D(bpy.types.FileHandler):
     bl_idname = "IO_FH_O3D"
     bl_label = "O3D"
     bl_import_operator = "import_scene.o3d"
-    #bl_export_operator = "export_scene.o3d"
+    bl_export_operator = "export_scene.o3d"
     bl_file_extensions = ".o3d"
 
     @classmethod
@@ -95,38 +435,298 @@ class IO_FH_O3D(bpy.types.FileHandler):
         return poll_file_object_drop(context)
 
 
+def scene_instances(o3d_file : O3DFile):
+    """Existing meshes by fingerprint if the import shares meshes, else None."""
+    return mesh_instances() if o3d_file.import_settings.get("instance_meshes", False) else None
+
+
+@profiling.timed("create_scene")
 def create_scene(o3d_file : O3DFile):
-    for gmo in o3d_file.gmobjects:
-        name = gmo.name
-        if gmo.is_collision:
-            name = "#coll"
+    for _ in scene_steps(o3d_file):
+        pass
+
+
+def scene_groups(o3d_file : O3DFile) -> list[list[GMObject]]:
+    """The loaded GMObjects in groups that become one Blender object each."""
+    gmobjects = [gmo for gmo in o3d_file.gmobjects if gmo.loaded]
+    if o3d_file.import_settings.get("merge_static", False):
+        return merge_groups(gmobjects)
+    return [[gmo] for gmo in gmobjects]
+
+
+def scene_step_count(o3d_file : O3DFile) -> int:
+    """Number of steps scene_steps yields for o3d_file."""
+    count = len(scene_groups(o3d_file))
+    if o3d_file.chr is not None:
+        count += 1
+    if o3d_file.import_settings["include_animations"]:
+        count += len(o3d_file.animations)
+    return count
 
-        blender_obj = create_blender_mesh(name, gmo, o3d_file.o3d)
+
+def scene_steps(o3d_file : O3DFile):
+    """
+    Build the Blender data of a parsed file, yielding after every mesh, the armature
+    and every action. A modal import runs a few steps per timer event.
+    """
+    textures = TextureResolver()
+    instances = scene_instances(o3d_file)
+    gmobjects = []
+    merged_count = 0
+    for group in scene_groups(o3d_file):
+        gmo = group[0]
+        if len(group) > 1:
+            merged_count += 1
+            name = f"Merged{merged_count}" + (f"-lod{gmo.lod_index + 1}" if o3d_file.o3d.lod else "")
+            gmo = merge_gmobjects(name, group)
+        gmobjects.append(gmo)
+
+        blender_obj = create_gmobject_mesh(o3d_file, gmo, textures, instances)
+        tag_source(blender_obj, o3d_file, group)
         if o3d_file.import_settings["hide_lod"] and gmo.lod_index > 0:
             blender_obj.hide_set(True)
 
         if o3d_file.import_settings["hide_coll"] and gmo.is_collision:
             blender_obj.hide_set(True)
+        yield
 
     if o3d_file.chr is not None:
-        create_blender_armature("Armature", o3d_file.chr, o3d_file.gmobjects)
+        create_blender_armature("Armature", o3d_file.chr, gmobjects)
+        tag_source(o3d_file.chr.blender_armature, o3d_file, [])
+        yield
 
     if o3d_file.import_settings["include_animations"]:
+        reduction = keyframe_reduction(o3d_file.import_settings)
         for ani in o3d_file.animations:
-            create_blender_action(o3d_file.chr, ani)
+            create_blender_action(o3d_file.chr, ani, reduction)
+            yield
+
+
+def keyframe_reduction(import_settings) -> tuple[float, float]:
+    """The position and angle tolerances for create_blender_action, None to keep every key."""
+    if not import_settings.get("reduce_keyframes", False):
+        return None
+    return (
+        import_settings.get("position_tolerance", DEFAULT_POSITION_TOLERANCE),
+        import_settings.get("angle_tolerance", DEFAULT_ANGLE_TOLERANCE),
+    )
+
+
+# Data an import can create, removed again when it is cancelled
+IMPORTED_DATA = ("objects", "meshes", "armatures", "actions", "materials", "images", "collections")
+
+# Custom object properties recording the model an object was imported from and the
+# indices of the GMObjects it holds, so geometry a lazy import skipped can be loaded later
+SOURCE_PROPERTY = "o3d_source"
+GMOBJECTS_PROPERTY = "o3d_gmobjects"
+
+
+class ImportTask:
+    """
+    An import split into parsing, which runs in a background thread, and scene_steps,
+    which run on the main thread a few at a time and need the user to stay out of the
+    scene until they are done. Parallel parsing forks its workers,
+    so it runs on the main thread instead and start waits for it. cancel removes the
+    data the steps created, anything made in the meantime by the user stays.
+    """
+    def __init__(self, o3d_file : O3DFile, import_settings, parallel : bool = False,
+                 profile : profiling.ImportProfile = None):
+        self.o3d_file = o3d_file
+        self.import_settings = import_settings
+        self.parallel = parallel
+        self.profile = profile
+        self.parse_job = None
+        self.steps = None
+        self.step_count = 0
+        self.done = 0
+        self.created : list[tuple[str, bpy.types.ID]] = [] # (bpy.data collection, datablock)
+
+
+    def read_model(self):
+        with self.profile or nullcontext():
+            if self.parallel:
+                self.o3d_file.read_model_parallel(self.import_settings)
+            else:
+                self.o3d_file.read_model(self.import_settings)
+
+
+    def start(self):
+        if self.parallel:
+            self.parse_job = Future()
+            try:
+                self.read_model()
+            except Exception as e:
+                self.parse_job.set_exception(e)
+            else:
+                self.parse_job.set_result(None)
+            return
+
+        executor = ThreadPoolExecutor(1)
+        self.parse_job = executor.submit(self.read_model)
+        executor.shutdown(wait=False)
+
+
+    def parsed(self) -> bool:
+        return self.parse_job.done()
+
+
+    def step(self, time_slice : float) -> bool:
+        """
+        Run scene steps for about time_slice seconds once parsing has finished. Returns
+        whether the import is complete, a parsing error is raised here.
+        """
+        if not self.parsed():
+            return False
+        if self.steps is None:
+            self.parse_job.result()
+            self.step_count = scene_step_count(self.o3d_file)
+            self.steps = scene_steps(self.o3d_file)
+
+        # Nothing else runs on the main thread during a slice, so what is new afterwards is
+        # ours. Between slices ImportO3D.modal keeps input from reaching the rest of Blender
+        existing = {name: set(getattr(bpy.data, name)) for name in IMPORTED_DATA}
+        try:
+            deadline = time.perf_counter() + time_slice
+            with self.profile or nullcontext():
+                for _ in self.steps:
+                    self.done += 1
+                    if time.perf_counter() >= deadline:
+                        return False
+            return True
+        finally:
+            for name in IMPORTED_DATA:
+                self.created.extend((name, data) for data in getattr(bpy.data, name) if data not in existing[name])
+
+
+    def cancel(self):
+        """Stop parsing after the current file and remove the data the steps created."""
+        self.o3d_file.cancelled = True
+        if self.steps is not None:
+            self.steps.close()
+
+        # Skip what the user already deleted
+        current = {name: set(getattr(bpy.data, name)) for name in IMPORTED_DATA}
+        bpy.data.batch_remove([data for name, data in self.created if data in current[name]])
+        self.created = []
+
+
+def tag_source(obj, o3d_file : O3DFile, gmobjects : list[GMObject]):
+    """Record the model file of an imported object and the GMObjects it was built from."""
+    obj[SOURCE_PROPERTY] = o3d_file.filepath
+    obj[GMOBJECTS_PROPERTY] = [i for i, gmo in enumerate(o3d_file.gmobjects) if gmo in gmobjects]
+
+
+def load_skipped(scene, source : str) -> int:
+    """
+    Build the GMObjects of the model at source that a lazy import skipped, linked to the
+    armature imported with it through the model's .chr. Returns how many were built.
+    """
+    imported = [obj for obj in scene.objects if obj.get(SOURCE_PROPERTY) == source]
+    present = {i for obj in imported for i in obj.get(GMOBJECTS_PROPERTY, ())}
+
+    # Reading lazily again only decodes the first level of detail, the rest is loaded by offset
+    o3d_file = O3DFile(source, lazy=True)
+    o3d_file.read_o3d({"hide_lod": True, "hide_coll": True, "include_animations": False})
+    skipped = [gmo for i, gmo in enumerate(o3d_file.gmobjects) if not gmo.loaded and i not in present]
+    if len(skipped) == 0:
+        return 0
+
+    # Bone palettes index the .chr, whose order the armature does not keep
+    armature = next((obj for obj in imported if obj.type == "ARMATURE"), None)
+    skel_name = find_skeleton(source)
+    if armature is not None and len(skel_name) > 0:
+        o3d_file.read_chr(skel_name)
+        o3d_file.chr.blender_armature = armature
+
+    create_deferred(o3d_file, skipped)
+    return len(skipped)
+
+
+def create_gmobject_mesh(o3d_file : O3DFile, gmo : GMObject, textures : TextureResolver = None,
+                         instances : dict = None):
+    name = gmo.name
+    if gmo.is_collision:
+        name = "#coll"
+
+    return create_blender_mesh(name, gmo, o3d_file.o3d, textures, instances)
+
+
+@profiling.timed("create_deferred")
+def create_deferred(o3d_file : O3DFile, gmobjects : list[GMObject] = None):
+    """
+    Decode and build the GMObjects a lazy import skipped, all of them unless gmobjects
+    is given, and link them to the armature created by create_scene.
+    """
+    textures = TextureResolver()
+    instances = scene_instances(o3d_file)
+    for gmo in gmobjects or o3d_file.gmobjects:
+        if gmo.loaded:
+            continue
+
+        o3d_file.load_gmobject(gmo)
+        tag_source(create_gmobject_mesh(o3d_file, gmo, textures, instances), o3d_file, [gmo])
+        if o3d_file.chr is not None and o3d_file.chr.blender_armature is not None:
+            link_to_armature(gmo, o3d_file.chr)
     
 
+def import_animations(arm_obj, filepaths : list[str], reduction : tuple[float, float] = None,
+                      use_cache : bool = True, replace : bool = True) -> list:
+    """
+    Key .ani animations onto an already imported armature, without reading the model
+    or its skeleton again. Bones are resolved by name, see gather_skeleton. With
+    replace, an existing action of the same name is remapped to the new one and
+    removed. Returns the created actions.
+    """
+    chr = gather_skeleton(arm_obj)
+    actions = []
+    for filepath in filepaths:
+        with profiling.stage("read_ani", filepath):
+            ani = O3DFile(filepath, use_cache=use_cache).read_ani(filepath)
+            count_parsed("ani", ani)
+        if ani is None:
+            continue
+
+        existing = bpy.data.actions.get(ani.name) if replace else None
+        create_blender_action(chr, ani, reduction)
+        action = arm_obj.animation_data.action
+        if existing is not None:
+            existing.user_remap(action)
+            bpy.data.actions.remove(existing)
+            action.name = ani.name
+        actions.append(action)
+    return actions
+
+
 def menu_func_import(self, context):
     self.layout.operator(ImportO3D.bl_idname, text="FlyFF (.o3d)")
+    self.layout.operator(ImportANI.bl_idname, text="FlyFF Animation (.ani)")
+
+
+def menu_func_object(self, context):
+    self.layout.operator(LoadSkippedO3D.bl_idname)
+
+
+def menu_func_export(self, context):
+    self.layout.operator(ExportO3D.bl_idname, text="FlyFF (.o3d)")
 
 
 def register():
     bpy.utils.register_class(ImportO3D)
+    bpy.utils.register_class(ImportANI)
+    bpy.utils.register_class(ExportO3D)
+    bpy.utils.register_class(LoadSkippedO3D)
     bpy.utils.register_class(IO_FH_O3D)
+    bpy.types.VIEW3D_MT_object.append(menu_func_object)
     bpy.types.TOPBAR_MT_file_import.append(menu_func_import)
+    bpy.types.TOPBAR_MT_file_export.append(menu_func_export)
 
 
 def unregister():
     bpy.utils.unregister_class(ImportO3D)
+    bpy.utils.unregister_class(ImportANI)
+    bpy.utils.unregister_class(ExportO3D)
+    bpy.utils.unregister_class(LoadSkippedO3D)
     bpy.utils.unregister_class(IO_FH_O3D)
+    bpy.types.VIEW3D_MT_object.remove(menu_func_object)
     bpy.types.TOPBAR_MT_file_import.remove(menu_func_import)
+    bpy.types.TOPBAR_MT_file_export.remove(menu_func_export)
@@ -0,0 +1,209 @@
+"""
+Metadata index of whole O3D asset libraries.
+
+Models are scanned without decoding any geometry: the header, the counts of every
+GMObject and the material texture names are read and all vertex and index buffers
+are skipped. The results are kept in a SQLite database that is updated incrementally,
+only new and modified files are scanned again.
+
+Run it through Blender, everything after "--" is passed to the indexer:
+
+    blender --background --python addons/io_o3d/asset_index.py -- <resource dir> <index.db> [options]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+if __name__ == "__main__":
+    # Started as a script by Blender, make the addon importable as a package
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from io_o3d.batch import find_models
+    from io_o3d.importer import O3DFile, find_skeleton
+else:
+    from .batch import find_models
+    from .importer import O3DFile, find_skeleton
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS models (
+    path TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    version INTEGER,
+    oid INTEGER,
+    lod INTEGER,
+    bone_count INTEGER,
+    frame_count INTEGER,
+    event_count INTEGER,
+    gmobject_count INTEGER,
+    skinned INTEGER,
+    collision INTEGER,
+    bbmin_x REAL, bbmin_y REAL, bbmin_z REAL,
+    bbmax_x REAL, bbmax_y REAL, bbmax_z REAL,
+    skeleton TEXT,
+    has_skeleton INTEGER,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS textures (
+    model TEXT NOT NULL REFERENCES models(path) ON DELETE CASCADE,
+    texture TEXT NOT NULL COLLATE NOCASE
+);
+CREATE INDEX IF NOT EXISTS textures_texture ON textures(texture);
+CREATE INDEX IF NOT EXISTS textures_model ON textures(model);
+"""
+
+
+class O3DScanner(O3DFile):
+    """O3DFile that skips the geometry buffers of every GMObject, see skip_geometry."""
+    def __init__(self, filepath : str, use_mmap : bool = False):
+        super().__init__(filepath, use_mmap, lazy=True)
+
+    def needed_geometry(self, gmo) -> bool:
+        return False
+
+
+def scan_model(filepath : str, use_mmap : bool = False) -> dict:
+    """Return the metadata of a model as a models row, plus its texture names."""
+    scanner = O3DScanner(filepath, use_mmap)
+    o3d = scanner.read_o3d({"hide_lod": True, "hide_coll": True})
+
+    meshes = [gmo for gmo in scanner.gmobjects if not gmo.is_collision]
+    textures = sorted({mat.texture_name for gmo in scanner.gmobjects for mat in gmo.materials if mat.texture_name})
+    return {
+        "version": o3d.version,
+        "oid": o3d.oid,
+        "lod": int(o3d.lod),
+        "bone_count": o3d.bone_count,
+        "frame_count": o3d.frame_count,
+        "event_count": o3d.event_count,
+        "gmobject_count": len(meshes),
+        "skinned": int(any(gmo.gm_type == 1 for gmo in meshes)),
+        "collision": int(len(meshes) < len(scanner.gmobjects)),
+        "bbmin_x": o3d.bbmin[0], "bbmin_y": o3d.bbmin[1], "bbmin_z": o3d.bbmin[2],
+        "bbmax_x": o3d.bbmax[0], "bbmax_y": o3d.bbmax[1], "bbmax_z": o3d.bbmax[2],
+        "textures": textures,
+    }
+
+
+def open_index(db_path : str) -> sqlite3.Connection:
+    db = sqlite3.connect(db_path)
+    db.execute("PRAGMA foreign_keys = ON")
+    db.executescript(SCHEMA)
+    return db
+
+
+def build_index(root : str, db_path : str, pattern : str = "*.o3d", use_mmap : bool = False) -> dict:
+    """
+    Scan every model below root into the index at db_path. Unchanged files keep their
+    rows, files that disappeared are removed. Returns scanned, skipped, removed and
+    failed counts.
+    """
+    db = open_index(db_path)
+    known = {path: (mtime_ns, size) for path, mtime_ns, size in db.execute("SELECT path, mtime_ns, size FROM models")}
+    stats = {"scanned": 0, "skipped": 0, "removed": 0, "failed": 0}
+
+    found = set()
+    with db:
+        for filepath in find_models(root, pattern):
+            path = os.path.abspath(filepath)
+            found.add(path)
+            stat = os.stat(path)
+
+            # Skeletons come and go independently of the model
+            skeleton = find_skeleton(path) or None
+            has_skeleton = int(skeleton is not None and os.path.exists(skeleton))
+
+            if known.get(path) == (stat.st_mtime_ns, stat.st_size):
+                db.execute("UPDATE models SET skeleton = ?, has_skeleton = ? WHERE path = ?", (skeleton, has_skeleton, path))
+                stats["skipped"] += 1
+                continue
+
+            row = {
+                "path": path,
+                "name": os.path.basename(path),
+                "mtime_ns": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "skeleton": skeleton,
+                "has_skeleton": has_skeleton,
+                "error": None,
+            }
+            textures = []
+            try:
+                metadata = scan_model(path, use_mmap)
+                textures = metadata.pop("textures")
+                row.update(metadata)
+                stats["scanned"] += 1
+            except Exception as e:
+                row["error"] = f"{type(e).__name__}: {e}"
+                stats["failed"] += 1
+
+            db.execute("DELETE FROM models WHERE path = ?", (path,))
+            db.execute(
+                f"INSERT INTO models ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+                tuple(row.values()),
+            )
+            db.executemany("INSERT INTO textures (model, texture) VALUES (?, ?)", [(path, t) for t in textures])
+
+        for path in set(known) - found:
+            if os.path.commonpath([path, os.path.abspath(root)]) == os.path.abspath(root):
+                db.execute("DELETE FROM models WHERE path = ?", (path,))
+                stats["removed"] += 1
+
+    db.close()
+    return stats
+
+
+def models_using_texture(db : sqlite3.Connection, texture : str) -> list[str]:
+    """Paths of all models with a material using texture, case-insensitively."""
+    rows = db.execute("SELECT DISTINCT model FROM textures WHERE texture = ? ORDER BY model", (texture,))
+    return [path for path, in rows]
+
+
+def models_missing_skeleton(db : sqlite3.Connection) -> list[str]:
+    """Paths of all mvr models whose .chr skeleton does not exist."""
+    rows = db.execute("SELECT path FROM models WHERE skeleton IS NOT NULL AND has_skeleton = 0 ORDER BY path")
+    return [path for path, in rows]
+
+
+def parse_args(argv : list[str]):
+    parser = argparse.ArgumentParser(
+        prog="blender --background --python asset_index.py --",
+        description="Index the metadata of a directory tree of FlyFF .o3d models",
+    )
+    parser.add_argument("input_dir", help="Directory searched recursively for models")
+    parser.add_argument("index", help="SQLite database file, created or updated")
+    parser.add_argument("--pattern", default="*.o3d", help="File name pattern of the models to index")
+    parser.add_argument("--mmap", action="store_true", help="Read files through memory mapping")
+    parser.add_argument("--texture", help="List the models using this texture after indexing")
+    parser.add_argument("--missing-skeleton", action="store_true", help="List the mvr models without a .chr after indexing")
+    return parser.parse_args(argv)
+
+
+def main(argv : list[str]) -> int:
+    args = parse_args(argv)
+
+    start = time.perf_counter()
+    stats = build_index(args.input_dir, args.index, args.pattern, args.mmap)
+    print(
+        f"Indexed {stats['scanned']} models in {time.perf_counter() - start:.2f}s "
+        f"({stats['skipped']} unchanged, {stats['removed']} removed, {stats['failed']} failed)"
+    )
+
+    db = open_index(args.index)
+    if args.texture:
+        for path in models_using_texture(db, args.texture):
+            print(path)
+    if args.missing_skeleton:
+        for path in models_missing_skeleton(db):
+            print(path)
+    db.close()
+
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    sys.exit(main(argv))
@@ -0,0 +1,190 @@
+"""
+Headless batch conversion of whole O3D asset trees.
+
+Run it through Blender, everything after "--" is passed to the converter:
+
+    blender --background --python addons/io_o3d/batch.py -- <input dir> <output dir> [options]
+
+Every model found under the input directory is imported together with its skeleton
+and animations, then written to the output directory with the same relative layout.
+"""
+import argparse
+import fnmatch
+import json
+import math
+import os
+import sys
+import time
+import traceback
+from contextlib import nullcontext
+import bpy
+
+if __name__ == "__main__":
+    # Started as a script by Blender, make the addon importable as a package
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from io_o3d import create_scene, profiling
+    from io_o3d.importer import O3DFile
+else:
+    from . import create_scene, profiling
+    from .importer import O3DFile
+
+
+OUTPUT_FORMATS = {
+    "blend": ".blend",
+    "fbx": ".fbx",
+    "glb": ".glb",
+}
+
+
+def find_models(input_dir : str, pattern : str = "*.o3d") -> list[str]:
+    """Return all model files below input_dir matching pattern, case-insensitively."""
+    models = []
+    for root, _, files in os.walk(input_dir):
+        for name in files:
+            if fnmatch.fnmatch(name.lower(), pattern.lower()):
+                models.append(os.path.join(root, name))
+
+    return sorted(models)
+
+
+def reset_scene():
+    """Remove all data created by a previous conversion."""
+    data = []
+    for collection in (bpy.data.objects, bpy.data.meshes, bpy.data.armatures,
+                       bpy.data.materials, bpy.data.images, bpy.data.actions):
+        data.extend(collection)
+
+    bpy.data.batch_remove(data)
+
+
+def write_scene(filepath : str, output_format : str):
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    if output_format == "blend":
+        bpy.ops.wm.save_as_mainfile(filepath=filepath, copy=True, check_existing=False)
+    elif output_format == "fbx":
+        bpy.ops.export_scene.fbx(filepath=filepath, check_existing=False)
+    elif output_format == "glb":
+        bpy.ops.export_scene.gltf(filepath=filepath, export_format="GLB", check_existing=False)
+    else:
+        raise ValueError(f"Unknown output format: {output_format}")
+
+
+def convert_file(filepath : str, output_path : str, import_settings, output_format : str = "blend",
+                 use_mmap : bool = False, columnar : bool = False, jobs : int = 0, use_cache : bool = True,
+                 use_sidecar : bool = False, profile : profiling.ImportProfile = None):
+    """
+    Import a single model into an empty scene and write it to output_path. With jobs > 0
+    the model files are parsed by that many parallel workers. Skeletons and animations
+    shared between models are parsed once when use_cache is set, use_sidecar keeps parsed
+    models and skeletons in cache files next to the sources for later runs. A given
+    profile records the stages of the conversion.
+    """
+    reset_scene()
+    with profile or nullcontext():
+        o3d_file = O3DFile(filepath, use_mmap=use_mmap, columnar=columnar, use_cache=use_cache, use_sidecar=use_sidecar)
+        if jobs > 0:
+            o3d_file.read_model_parallel(import_settings, jobs)
+        else:
+            o3d_file.read_model(import_settings)
+        create_scene(o3d_file)
+        with profiling.stage("write_scene", output_path):
+            write_scene(output_path, output_format)
+
+
+def convert_tree(input_dir : str, output_dir : str, import_settings, output_format : str = "blend",
+                 pattern : str = "*.o3d", use_mmap : bool = False, columnar : bool = False,
+                 jobs : int = 0, use_cache : bool = True, use_sidecar : bool = False,
+                 profile : bool = False, use_cprofile : bool = False) -> list[dict]:
+    """
+    Convert every model below input_dir. Failures do not stop the run, each model gets
+    a result entry with its output path, wall time and error message (None on success).
+    With profile, the entry also holds the ImportProfile report of the model.
+    """
+    results = []
+    for filepath in find_models(input_dir, pattern):
+        relative = os.path.relpath(filepath, input_dir)
+        output_path = os.path.join(output_dir, os.path.splitext(relative)[0] + OUTPUT_FORMATS[output_format])
+
+        start = time.perf_counter()
+        error = None
+        model_profile = profiling.ImportProfile(filepath, use_cprofile) if profile else None
+        try:
+            convert_file(filepath, output_path, import_settings, output_format, use_mmap, columnar, jobs,
+                         use_cache, use_sidecar, model_profile)
+        except Exception as e:
+            traceback.print_exc()
+            error = f"{type(e).__name__}: {e}"
+
+        result = {
+            "path": filepath,
+            "output": output_path,
+            "seconds": time.perf_counter() - start,
+            "error": error,
+        }
+        if model_profile is not None:
+            result["profile"] = model_profile.report()
+        results.append(result)
+        status = "FAILED " + error if error else "ok"
+        print(f"[{len(results)}] {relative}: {result['seconds']:.2f}s {status}")
+
+    return results
+
+
+def parse_args(argv : list[str]):
+    parser = argparse.ArgumentParser(
+        prog="blender --background --python batch.py --",
+        description="Convert a directory tree of FlyFF .o3d models",
+    )
+    parser.add_argument("input_dir", help="Directory searched recursively for models")
+    parser.add_argument("output_dir", help="Directory the converted files are written to")
+    parser.add_argument("--format", choices=sorted(OUTPUT_FORMATS), default="blend", help="Output file format")
+    parser.add_argument("--pattern", default="*.o3d", help="File name pattern of the models to convert")
+    parser.add_argument("--no-animations", action="store_true", help="Skip .ani animations")
+    parser.add_argument("--reduce-keyframes", action="store_true", help="Drop animation keys linear interpolation reproduces")
+    parser.add_argument("--position-tolerance", type=float, default=0.001, help="Position error bound of --reduce-keyframes")
+    parser.add_argument("--angle-tolerance", type=float, default=0.1, help="Angle error bound of --reduce-keyframes, in degrees")
+    parser.add_argument("--merge-static", action="store_true", help="Join the static meshes sharing a parent into one mesh")
+    parser.add_argument("--show-lods", action="store_true", help="Do not hide level of detail meshes")
+    parser.add_argument("--show-collision", action="store_true", help="Do not hide collision meshes")
+    parser.add_argument("--mmap", action="store_true", help="Read files through memory mapping")
+    parser.add_argument("--columnar", action="store_true", help="Keep geometry in NumPy arrays while parsing")
+    parser.add_argument("--jobs", type=int, default=0, help="Parse each model's files with this many workers")
+    parser.add_argument("--no-cache", action="store_true", help="Parse shared skeletons and animations again for every model")
+    parser.add_argument("--sidecar", action="store_true", help="Reuse and write .cache files of parsed models next to them")
+    parser.add_argument("--profile", metavar="REPORT", help="Time the stages of every conversion and write them to this JSON file")
+    parser.add_argument("--cprofile", action="store_true", help="Add the slowest functions under cProfile to the --profile report")
+    return parser.parse_args(argv)
+
+
+def main(argv : list[str]) -> int:
+    args = parse_args(argv)
+    import_settings = {
+        "filepath": "",
+        "hide_lod": not args.show_lods,
+        "hide_coll": not args.show_collision,
+        "include_animations": not args.no_animations,
+        "reduce_keyframes": args.reduce_keyframes,
+        "position_tolerance": args.position_tolerance,
+        "angle_tolerance": math.radians(args.angle_tolerance),
+        "merge_static": args.merge_static,
+    }
+
+    start = time.perf_counter()
+    results = convert_tree(args.input_dir, args.output_dir, import_settings, args.format,
+                           args.pattern, args.mmap, args.columnar, args.jobs, not args.no_cache, args.sidecar,
+                           args.profile is not None, args.cprofile)
+    if args.profile:
+        with open(args.profile, "w") as f:
+            json.dump({"models": results}, f, indent=2)
+
+    failed = [r for r in results if r["error"]]
+    print(f"Converted {len(results) - len(failed)}/{len(results)} models in {time.perf_counter() - start:.2f}s")
+    for result in failed:
+        print(f"  FAILED {result['path']}: {result['error']}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    sys.exit(main(argv))
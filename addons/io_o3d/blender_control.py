@@ -1,5 +1,9 @@
-import sys
+import hashlib
+import os
+import re
+import numpy as np
 from .o3d_types import *
+from . import profiling
 from bpy.types import Object
 
 
@@ -9,6 +13,8 @@ from bpy.types import Object
 def convert_pos(x): return Vector([x[0], x[2], x[1]])
 def convert_quat(q): return Quaternion([q[3], q[0], -q[2], q[1]])
 def convert_scale(s): return Vector([s[0], s[2], s[1]])
+def convert_pos_array(a): return np.asarray(a, dtype=np.float32).reshape(-1, 3)[:, (0, 2, 1)]
+def convert_quat_array(q): return np.asarray(q, dtype=np.float32).reshape(-1, 4)[:, (3, 0, 2, 1)] * (1, 1, -1, 1)
 def convert_matrix(m):
     return Matrix([
         [m[0], m[8], m[4], m[12]],
@@ -17,23 +23,162 @@ def convert_matrix(m):
         [m[3], m[11], m[7], m[15]],
     ])
 
+# Blender Z-up space --> Y-up space, the inverse of the conversions above
+
+def revert_pos_array(a): return np.asarray(a, dtype=np.float32).reshape(-1, 3)[:, (0, 2, 1)]
+def revert_quat(q): return (q[1], q[3], -q[2], q[0])
+def revert_matrix(m):
+    return (
+        m[0][0], m[2][0], m[1][0], m[3][0],
+        m[0][2], m[2][2], m[1][2], m[3][2],
+        m[0][1], m[2][1], m[1][1], m[3][1],
+        m[0][3], m[2][3], m[1][3], m[3][3],
+    )
+
+# Holds helper objects like the bone shape, never exported
+SPECIAL_COLLECTION = "o3d_not_exported"
+# Custom mesh property holding the geometry_fingerprint a mesh was built from
+FINGERPRINT_PROPERTY = "o3d_fingerprint"
+
+
+# Quaternion products as 4x4 matrices over (w, x, y, z) vectors
+def quat_left_matrix(a):
+    """Matrix M with M @ b == a @ b."""
+    w, x, y, z = a
+    return np.array([
+        [w, -x, -y, -z],
+        [x, w, -z, y],
+        [y, z, w, -x],
+        [z, -y, x, w],
+    ])
+
+def quat_right_matrix(b):
+    """Matrix M with M @ a == a @ b."""
+    w, x, y, z = b
+    return np.array([
+        [w, -x, -y, -z],
+        [x, w, z, -y],
+        [y, -z, w, x],
+        [z, y, -x, w],
+    ])
+
+# Rotation solve_chr_space applies to every bone below the root, so bones point along their children
+PRETTIFY_ROTATION = (2**0.5 / 2, 2**0.5 / 2, 0, 0)
+
+# File (x, y, z, w) animation rotation --> Blender (w, x, y, z), see create_blender_action
+ANIM_ROT_TO_BLENDER = np.array([
+    [0, 0, 0, 1],
+    [-1, 0, 0, 0],
+    [0, 0, -1, 0],
+    [0, -1, 0, 0],
+])
+
+
+def pose_conversion(bone : Bone):
+    """
+    Fold the axis swap and rest pose correction applied to every animation key of
+    a bone into a 3x4 affine location transform and a 4x4 rotation transform, both
+    acting on the raw (x, y, z) / (x, y, z, w) values read from the file.
+    """
+    edit_rot_inv = bone.editbone_rot.conjugated()
+    to_pose = edit_rot_inv @ bone.rotation_after
+
+    location = np.zeros((3, 4))
+    location[:, :3] = np.array(to_pose.to_matrix())[:, (0, 2, 1)]
+    location[:, 3] = edit_rot_inv @ -bone.editbone_trans
+
+    rotation = quat_left_matrix(to_pose) @ quat_right_matrix(bone.rotation_before) @ ANIM_ROT_TO_BLENDER
+    return location, rotation
+
+
+# Texture directory -> (modification time, {lower case file name: file name})
+texture_directories = {}
+
 
-def create_blender_mesh(name: str, gmo: GMObject, o3d: Object3D) -> Object:
+class TextureResolver:
     """
-    Create a blender mesh from the given GMObject.
+    Finds the images of material textures in the Texture directory next to a model.
+    Each directory is listed once and looked up case-insensitively, images are shared
+    with every material using the same file. Loading an image only opens its file,
+    Blender reads the pixels when they are first displayed.
     """
-    mesh = bpy.data.meshes.new(name)
-    obj = bpy.data.objects.new(mesh.name, mesh)
+    def __init__(self):
+        self.images = {os.path.normcase(bpy.path.abspath(image.filepath)): image
+                       for image in bpy.data.images if image.source == "FILE"}
+        self.missing = set()
+
+
+    @staticmethod
+    def list_directory(directory : str) -> dict:
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            return {}
+
+        cached = texture_directories.get(directory)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, {name.lower(): name for name in os.listdir(directory)})
+            texture_directories[directory] = cached
+        return cached[1]
+
+
+    def find(self, model_path : str, texture_name : str) -> str:
+        """Return the path of a texture used by the model, or None if it does not exist."""
+        directory = os.path.join(os.path.dirname(model_path), "Texture")
+        name = self.list_directory(directory).get(texture_name.lower())
+        return os.path.join(directory, name) if name else None
+
+
+    def image(self, model_path : str, texture_name : str):
+        """Return the image of a texture used by the model, or None if it does not exist."""
+        path = self.find(model_path, texture_name)
+        if path is None:
+            if texture_name not in self.missing:
+                self.missing.add(texture_name)
+                print("Texture not found:", os.path.join(os.path.dirname(model_path), "Texture", texture_name))
+            return None
+
+        key = os.path.normcase(path)
+        image = self.images.get(key)
+        if image is None:
+            try:
+                image = bpy.data.images.load(path, check_existing=True)
+            except RuntimeError:
+                print("Texture could not be read:", path)
+                return None
+            self.images[key] = image
+        return image
+
+
+@profiling.timed("create_blender_mesh")
+def create_blender_mesh(name: str, gmo: GMObject, o3d: Object3D, textures : TextureResolver = None,
+                        instances : dict = None) -> Object:
+    """
+    Create a blender mesh from the given GMObject. Textures are resolved through
+    textures, pass the same resolver for all meshes of an import. With an instances
+    dict from mesh_instances, unskinned GMObjects with the same geometry share one mesh.
+    """
+    if textures is None:
+        textures = TextureResolver()
+
+    mesh = None
+    if instances is not None and gmo.gm_type != 1:
+        fingerprint = geometry_fingerprint(gmo)
+        mesh = instances.get(fingerprint)
+
+    if mesh is None:
+        mesh = bpy.data.meshes.new(name)
+        build_blender_mesh(mesh, gmo, o3d, textures)
+        if instances is not None and gmo.gm_type != 1:
+            mesh[FINGERPRINT_PROPERTY] = fingerprint
+            instances[fingerprint] = mesh
+
+    # A shared mesh keeps the name of the GMObject it was first built for
+    obj = bpy.data.objects.new(mesh.name if mesh.users == 0 else name, mesh)
     col = bpy.data.collections["Collection"]
     col.objects.link(obj)
     
     bpy.context.view_layer.objects.active = obj
-    
-    vertices = [convert_pos(v) for v in gmo.vertices]
-    mesh.from_pydata(vertices, [], gmo.indices)
-    # TODO: Set normals from gmo.normals
-    mesh.validate()
-    mesh.update()
 
     if gmo.gm_type != 1 and len(gmo.transform) > 0:
         obj.matrix_local = convert_matrix(gmo.transform)
@@ -41,22 +186,171 @@ def create_blender_mesh(name: str, gmo: GMObject, o3d: Object3D) -> Object:
     # Non-bone animation
     if len(gmo.frames) > 0:
         obj.rotation_mode = 'QUATERNION'
-        for i, frame in enumerate(gmo.frames):
-            obj.location = convert_pos(frame.pos)
-            obj.rotation_quaternion = convert_quat(frame.rot)
+        obj.animation_data_create()
+        obj.animation_data.action = bpy.data.actions.new(name=obj.name + "Action")
 
-            obj.keyframe_insert(data_path="location", frame=i)
-            obj.keyframe_insert(data_path="rotation_quaternion", frame=i)
+        positions = convert_pos_array(gmo.frames[:, FRAME_POS])
+        rotations = convert_quat_array(gmo.frames[:, FRAME_ROT])
+        write_fcurves(obj.animation_data.action, "location", positions, "Object Transforms")
+        write_fcurves(obj.animation_data.action, "rotation_quaternion", rotations, "Object Transforms")
 
     if o3d.frame_count > 0:
         bpy.context.scene.frame_start = 0
         bpy.context.scene.frame_end = o3d.frame_count
 
+    gmo.blender_obj = obj
+    return obj
+
+
+def geometry_fingerprint(gmo : GMObject) -> str:
+    """Hash of the geometry and materials of a GMObject, equal for meshes that can be shared."""
+    digest = hashlib.blake2b(digest_size=16)
+    columns = ((gmo.vertices, np.float32), (gmo.normals, np.float32), (gmo.uvs, np.float32), (gmo.indices, np.uint16))
+    for data, dtype in columns:
+        digest.update(np.ascontiguousarray(np.asarray(data, dtype=dtype)).tobytes())
+        digest.update(b"|")
+
+    digest.update(repr((
+        gmo.opacity,
+        [mat.texture_name for mat in gmo.materials],
+        [(block.primitive_count, block.material_id) for block in gmo.material_blocks],
+    )).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def mesh_instances() -> dict:
+    """Meshes created with instancing so far, by geometry_fingerprint."""
+    return {mesh[FINGERPRINT_PROPERTY]: mesh for mesh in bpy.data.meshes if FINGERPRINT_PROPERTY in mesh}
+
+
+def mergeable(gmo : GMObject) -> bool:
+    """Whether a GMObject is static, so its transform can be baked into a merged mesh."""
+    return gmo.gm_type == 0 and len(gmo.frames) == 0 and not gmo.is_collision
+
+
+def merge_groups(gmobjects : list[GMObject]) -> list[list[GMObject]]:
+    """
+    Group the static GMObjects of the same level of detail and parent, in the order
+    of their first member. Every other GMObject is a group of its own.
+    """
+    groups = []
+    merged = {}
+    for gmo in gmobjects:
+        if not mergeable(gmo):
+            groups.append([gmo])
+            continue
+
+        key = (gmo.lod_index, gmo.parent_id, gmo.parent_gm_type if gmo.parent_id != -1 else 0)
+        if key not in merged:
+            merged[key] = []
+            groups.append(merged[key])
+        merged[key].append(gmo)
+    return groups
+
+
+def merge_gmobjects(name : str, gmobjects : list[GMObject]) -> GMObject:
+    """
+    Concatenate static GMObjects into one, with their transforms baked into the vertices.
+    Indices are offset into the joined vertex arrays and materials with the same texture
+    share a slot. The result only holds what build_blender_mesh reads.
+    """
+    first = gmobjects[0]
+    merged = GMObject()
+    merged.name = name
+    merged.lod_index = first.lod_index
+    merged.parent_id = first.parent_id
+    merged.parent_gm_type = first.parent_gm_type
+    merged.rotation_before = first.rotation_before
+    merged.rotation_after = first.rotation_after
+    merged.transform = tuple(np.eye(4, dtype=np.float32).ravel().tolist())
+    merged.opacity = any(gmo.opacity for gmo in gmobjects)
+
+    vertices, normals, uvs, indices, face_slots = [], [], [], [], []
+    slots = {} # texture name -> material slot
+    offset = 0
+    for gmo in gmobjects:
+        # Row vectors, p' = p @ M
+        matrix = np.asarray(gmo.transform, dtype=np.float64).reshape(4, 4) if len(gmo.transform) > 0 else np.eye(4)
+        positions = np.asarray(gmo.vertices, dtype=np.float64).reshape(-1, 3)
+        vertices.append(positions @ matrix[:3, :3] + matrix[3, :3])
+
+        vertex_normals = np.asarray(gmo.normals, dtype=np.float64).reshape(-1, 3) @ np.linalg.inv(matrix[:3, :3]).T
+        lengths = np.linalg.norm(vertex_normals, axis=1, keepdims=True)
+        normals.append(vertex_normals / np.where(lengths > 0, lengths, 1))
+        uvs.append(np.asarray(gmo.uvs, dtype=np.float32).reshape(-1, 2))
+
+        faces = np.asarray(gmo.indices, dtype=np.int64).reshape(-1, 3)
+        indices.append(faces + offset)
+        offset += len(positions)
+
+        remap = []
+        for mat in gmo.materials:
+            if mat.texture_name not in slots:
+                slots[mat.texture_name] = len(merged.materials)
+                merged.materials.append(mat)
+            remap.append(slots[mat.texture_name])
+
+        # The same face assignment build_blender_mesh makes from the blocks
+        gmo_slots = np.full(len(faces), remap[0] if remap else 0, dtype=np.int64)
+        start = 0
+        for block in gmo.material_blocks:
+            end = start + block.primitive_count
+            if block.material_id < len(remap):
+                gmo_slots[start:end] = remap[block.material_id]
+            start = end
+        face_slots.append(gmo_slots)
+
+    merged.vertices = np.concatenate(vertices).astype(np.float32)
+    merged.normals = np.concatenate(normals).astype(np.float32)
+    merged.uvs = np.concatenate(uvs)
+    merged.indices = np.concatenate(indices).astype(np.int32)
+    merged.vertex_count = len(merged.vertices)
+    merged.index_count = merged.indices.size
+    if merged.vertex_count > 0:
+        merged.bbmin = tuple(merged.vertices.min(axis=0).tolist())
+        merged.bbmax = tuple(merged.vertices.max(axis=0).tolist())
+
+    # One block per run of faces with the same slot
+    face_slots = np.concatenate(face_slots)
+    starts = np.flatnonzero(np.r_[True, face_slots[1:] != face_slots[:-1]]) if len(face_slots) > 0 else []
+    ends = np.r_[starts[1:], len(face_slots)]
+    for start, end in zip(starts, ends):
+        block = MaterialBlock()
+        block.start_vertex = int(start) * 3
+        block.primitive_count = int(end - start)
+        block.material_id = int(face_slots[start])
+        merged.material_blocks.append(block)
+    merged.material_count = len(merged.materials)
+    merged.material_block_count = len(merged.material_blocks)
+    return merged
+
+
+def build_blender_mesh(mesh, gmo : GMObject, o3d : Object3D, textures : TextureResolver):
+    """Fill an empty mesh with the geometry, UVs and materials of a GMObject."""
+    positions = convert_pos_array(gmo.vertices)
+    faces = np.asarray(gmo.indices, dtype=np.int32).reshape(-1, 3)
+
+    mesh.vertices.add(len(positions))
+    mesh.vertices.foreach_set("co", positions.ravel())
+    mesh.loops.add(faces.size)
+    mesh.loops.foreach_set("vertex_index", faces.ravel())
+    mesh.polygons.add(len(faces))
+    mesh.polygons.foreach_set("loop_start", np.arange(0, faces.size, 3, dtype=np.int32))
+    mesh.update(calc_edges=True)
+    mesh.validate()
+
+    # validate() may have dropped faces, so read the loops back
+    loop_vertices = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", loop_vertices)
+
+    # The file's vertex normals as custom split normals, flat faces would override them
+    mesh.shade_smooth()
+    if len(gmo.normals) > 0:
+        mesh.normals_split_custom_set(convert_pos_array(gmo.normals)[loop_vertices])
+
     uv_layer = mesh.uv_layers.new(name="UVMap")
-    for poly in mesh.polygons:
-        for loop_index in poly.loop_indices:
-            vert_index = mesh.loops[loop_index].vertex_index
-            uv_layer.data[loop_index].uv = gmo.uvs[vert_index]
+    uvs = np.asarray(gmo.uvs, dtype=np.float32).reshape(-1, 2)
+    uv_layer.data.foreach_set("uv", uvs[loop_vertices].ravel())
 
     # Make new materials
     for mat in gmo.materials:
@@ -69,38 +363,35 @@ def create_blender_mesh(name: str, gmo: GMObject, o3d: Object3D) -> Object:
             bsdf_node = new_mat.node_tree.nodes[0]
             bsdf_node.inputs["Roughness"].default_value = 1.0
             bsdf_node.inputs["IOR"].default_value = 1.0
-            if sys.platform != "win32":
-                texture_path = o3d.path[:o3d.path.rfind("/")] + "/Texture/" + mat.texture_name
-            else:
-                texture_path = o3d.path[:o3d.path.rfind("\\")] + "\\Texture\\" + mat.texture_name
-                
-            try:
-                image = bpy.data.images.load(texture_path)
+
+            image = textures.image(o3d.path, mat.texture_name)
+            if image is not None:
                 texture_node = new_mat.node_tree.nodes.new("ShaderNodeTexImage")
                 texture_node.image = image
                 new_mat.node_tree.links.new(texture_node.outputs["Color"], bsdf_node.inputs["Base Color"])
 
                 if gmo.opacity:
                     new_mat.node_tree.links.new(texture_node.outputs["Alpha"], bsdf_node.inputs["Alpha"])
-            except RuntimeError:
-                print("Texture not found:", texture_path)
 
         mesh.materials.append(new_mat)
 
     # Set material indices for each face
+    material_indices = np.zeros(len(mesh.polygons), dtype=np.int32)
     start = 0
     for mat_block in gmo.material_blocks:
-        for i in range(start, start + mat_block.primitive_count):
-            mesh.polygons[min(i, len(mesh.polygons) - 1)].material_index = mat_block.material_id
-        start += mat_block.primitive_count
+        end = start + mat_block.primitive_count
+        material_indices[start:end] = mat_block.material_id
+        if end > len(material_indices) > 0:
+            material_indices[-1] = mat_block.material_id
+        start = end
 
-    mesh.validate()
+    mesh.polygons.foreach_set("material_index", material_indices)
     mesh.update()
-
-    gmo.blender_obj = obj
-    return obj
+    profiling.count("vertices", len(mesh.vertices))
+    profiling.count("faces", len(mesh.polygons))
 
 
+@profiling.timed("create_blender_armature")
 def create_blender_armature(name : str, chr : Skeleton, gmobjects : list[GMObject]):
         arm_data = bpy.data.armatures.new(name)
         arm_obj = bpy.data.objects.new(name, arm_data)
@@ -110,7 +401,6 @@ def create_blender_armature(name : str, chr : Skeleton, gmobjects : list[GMObjec
         arm_obj.data.show_names = True
         arm_obj.data.relation_line_position = "HEAD"
 
-        SPECIAL_COLLECTION = "o3d_not_exported"
         if SPECIAL_COLLECTION not in bpy.data.collections:
             bpy.data.collections.new(SPECIAL_COLLECTION)
             bpy.data.scenes[bpy.context.scene.name].collection.children.link(bpy.data.collections[SPECIAL_COLLECTION])
@@ -178,91 +468,534 @@ def create_blender_armature(name : str, chr : Skeleton, gmobjects : list[GMObjec
             pbone.custom_shape_scale_xyz = Vector([armature_min_dim * 0.05] * 3)
             pbone.use_custom_shape_bone_size = False
 
-        # Set any gameobject parents to bones
-        for gmo in gmobjects:
-            if gmo.parent_id != -1 and gmo.parent_gm_type == 2:
-                bone = chr.bones[gmo.parent_id]
-                gmo.blender_obj.parent = arm_obj
-                gmo.blender_obj.parent_type = "BONE"
-                gmo.blender_obj.parent_bone = bone.name
-
-                t, r, s = convert_matrix(gmo.transform).decompose()
-                t, r, s = (gmo.rotation_after @ t, gmo.rotation_after @ r @ gmo.rotation_before, s)
-                gmo.blender_obj.rotation_mode = "QUATERNION"
-                gmo.blender_obj.location = t
-                gmo.blender_obj.rotation_quaternion = r
-                gmo.blender_obj.scale = s
-
-        # Link the armature to the mesh
+        chr.blender_armature = arm_obj
+        profiling.count("bones", len(chr.bones))
+
         for gmo in gmobjects:
-            if gmo.gm_type != 1: continue
+            if gmo.blender_obj is not None:
+                link_to_armature(gmo, chr)
 
-            obj = gmo.blender_obj
-            mod = obj.modifiers.new(name="ArmatureMod", type="ARMATURE")
-            mod.object = arm_obj
 
-            bone_ids = []
-            if gmo.used_bone_count > 0:
-                bone_ids = gmo.used_bones
-            else:
-                bone_ids = [i for i in range(28)]
+def link_to_armature(gmo : GMObject, chr : Skeleton):
+    """Parent the mesh of a GMObject to its bone, or let the armature deform it if skinned."""
+    arm_obj = chr.blender_armature
 
-            for block in gmo.material_blocks:
-                if block.used_bone_count > 0:
-                    bone_ids = block.used_bones                
+    # Set any gameobject parents to bones
+    if gmo.parent_id != -1 and gmo.parent_gm_type == 2:
+        bone = chr.bones[gmo.parent_id]
+        gmo.blender_obj.parent = arm_obj
+        gmo.blender_obj.parent_type = "BONE"
+        gmo.blender_obj.parent_bone = bone.name
 
-                for bone_id in bone_ids:
-                    if bone_id < len(chr.bones) and chr.bones[bone_id].name not in obj.vertex_groups:
-                        obj.vertex_groups.new(name=chr.bones[bone_id].name)
+        t, r, s = convert_matrix(gmo.transform).decompose()
+        t, r, s = (gmo.rotation_after @ t, gmo.rotation_after @ r @ gmo.rotation_before, s)
+        gmo.blender_obj.rotation_mode = "QUATERNION"
+        gmo.blender_obj.location = t
+        gmo.blender_obj.rotation_quaternion = r
+        gmo.blender_obj.scale = s
 
-                for i in range(block.primitive_count * 3):
-                    v_id = block.start_vertex + i
-                    vertex_id = gmo.indices[v_id // 3][v_id % 3]
-                    weight1, weight2 = gmo.weights[vertex_id]
-                    bone1, bone2 = gmo.bone_ids[vertex_id]
+    # Link the armature to the mesh
+    if gmo.gm_type == 1:
+        obj = gmo.blender_obj
+        mod = obj.modifiers.new(name="ArmatureMod", type="ARMATURE")
+        mod.object = arm_obj
 
-                    if weight1 != 0:
-                        obj.vertex_groups[chr.bones[bone_ids[bone1 // 3]].name].add([vertex_id], weight1, "REPLACE")
-                    if weight2 != 0:
-                        obj.vertex_groups[chr.bones[bone_ids[bone2 // 3]].name].add([vertex_id], weight2, "REPLACE")
+        assign_vertex_weights(obj, gmo, chr)
 
-        chr.blender_armature = arm_obj
 
+@profiling.timed("assign_vertex_weights")
+def assign_vertex_weights(obj : Object, gmo : GMObject, chr : Skeleton):
+    """
+    Fill the vertex groups of a skinned mesh from its two-bone vertex weights. Each
+    material block is resolved through its bone palette in one go and vertices are
+    added with one call per bone and weight, rather than one per face corner.
+    """
+    indices = np.asarray(gmo.indices, dtype=np.int64).ravel()
+    weights = np.asarray(gmo.weights, dtype=np.float32).reshape(-1, 2)
+    palette_slots = np.asarray(gmo.bone_ids, dtype=np.int64).reshape(-1, 2) // 3
+
+    bone_ids = []
+    if gmo.used_bone_count > 0:
+        bone_ids = gmo.used_bones
+    else:
+        bone_ids = [i for i in range(28)]
+
+    for block in gmo.material_blocks:
+        if block.used_bone_count > 0:
+            bone_ids = block.used_bones
+
+        for bone_id in bone_ids:
+            if bone_id < len(chr.bones) and chr.bones[bone_id].name not in obj.vertex_groups:
+                obj.vertex_groups.new(name=chr.bones[bone_id].name)
+                profiling.count("vertex_groups")
+
+        block_indices = indices[block.start_vertex:block.start_vertex + block.primitive_count * 3]
+        vertex_ids = np.unique(block_indices)
+        palette = np.asarray(bone_ids, dtype=np.int64)
+
+        # Second weights go last so they win when both slots name the same bone
+        for slot in range(2):
+            slot_weights = weights[vertex_ids, slot]
+            used = slot_weights != 0
+            ids = vertex_ids[used]
+            slot_weights = slot_weights[used]
+            bones = palette[palette_slots[ids, slot]]
+
+            valid = bones < len(chr.bones)
+            ids, slot_weights, bones = ids[valid], slot_weights[valid], bones[valid]
+            if len(ids) == 0:
+                continue
 
-def create_blender_action(chr: Skeleton, ani: Motion):
+            # Bucket vertices sharing the same bone and weight
+            order = np.lexsort((slot_weights, bones))
+            ids, slot_weights, bones = ids[order], slot_weights[order], bones[order]
+            changes = (bones[1:] != bones[:-1]) | (slot_weights[1:] != slot_weights[:-1])
+            starts = np.flatnonzero(np.r_[True, changes])
+            ends = np.r_[starts[1:], len(ids)]
+
+            for start, end in zip(starts, ends):
+                group = obj.vertex_groups[chr.bones[bones[start]].name]
+                group.add(ids[start:end].tolist(), float(slot_weights[start]), "REPLACE")
+                profiling.count("vertex_group_adds")
+                profiling.count("weights", end - start)
+
+
+@profiling.timed("create_blender_action")
+def create_blender_action(chr: Skeleton, ani: Motion, reduction : tuple[float, float] = None):
+        """
+        Key the animation of every bone on a new action. With reduction, a pair of
+        position and angle (radians) tolerances, keys that linear interpolation reproduces
+        within them are dropped, see reduce_keys.
+        """
         action = bpy.data.actions.new(name=ani.name)
+        action.use_fake_user = True # only the last action stays assigned, keep the rest on save
         if not chr.blender_armature.animation_data:
             chr.blender_armature.animation_data_create()
 
         chr.blender_armature.animation_data.action = action
 
-        for i, frame in enumerate(ani.frames):
-            bone = chr.bones[i]
-            pbone = chr.blender_armature.pose.bones.get(bone.name)
-            if not pbone:
+        # Keys are matched to bones by name, the armature may come from another skeleton version
+        bones = {bone.name: bone for bone in chr.bones}
+        for ani_bone, frame in zip(ani.bones, ani.frames):
+            bone = bones.get(ani_bone.name)
+            pbone = chr.blender_armature.pose.bones.get(ani_bone.name)
+            if bone is None or not pbone or len(frame.frames) == 0:
                 continue
 
-            for j, f in enumerate(frame.frames):
-                pos_adj = (f.pos[0], f.pos[1], -f.pos[2])
-                pos_val = convert_pos(pos_adj)
-                pos_val[1] = -pos_val[1]
-                pos_val = bone.rotation_after @ pos_val
+            if bone.pose_conversion is None:
+                bone.pose_conversion = pose_conversion(bone)
+            location, rotation = bone.pose_conversion
+
+            keys = np.asarray(frame.frames, dtype=np.float64)
+            locations = keys[:, FRAME_POS] @ location[:, :3].T + location[:, 3]
+            rotations = keys[:, FRAME_ROT] @ rotation.T
+
+            if reduction is None:
+                write_fcurves(action, pbone.path_from_id("location"), locations, bone.name)
+                write_fcurves(action, pbone.path_from_id("rotation_quaternion"), rotations, bone.name)
+            else:
+                position_tolerance, angle_tolerance = reduction
+                location_frames = reduce_keys(locations, position_tolerance, position_errors)
+                rotation_frames = reduce_keys(rotations, angle_tolerance, rotation_errors)
+                write_fcurves(action, pbone.path_from_id("location"), locations[location_frames], bone.name,
+                              location_frames, "LINEAR")
+                write_fcurves(action, pbone.path_from_id("rotation_quaternion"), rotations[rotation_frames], bone.name,
+                              rotation_frames, "LINEAR")
+                profiling.count("reduced_keyframes", max(len(location_frames), len(rotation_frames)))
+            profiling.count("keyframes", len(keys))
+
+            #bpy.context.scene.frame_start = 0
+            #bpy.context.scene.frame_end = len(frame.frames) - 1
+
 
-                rot_adj = (-f.rot[0], -f.rot[1], f.rot[2], f.rot[3])
-                rot_val = convert_quat(rot_adj)
-                rot_val = bone.rotation_after @ rot_val @ bone.rotation_before
+def write_fcurves(action, data_path : str, values, group : str, frames = None, interpolation : str = None):
+    """
+    Key each channel of values (frames x channels) on its own F-curve of data_path,
+    at the given frame numbers or one key per frame from frame 0. Keyframe points are
+    allocated once and filled in bulk instead of going through keyframe_insert.
+    """
+    values = np.asarray(values, dtype=np.float32)
+    if frames is None:
+        frames = np.arange(len(values), dtype=np.float32)
+    frames = np.asarray(frames, dtype=np.float32)
 
-                edit_trans, edit_rot = bone.editbone_trans, bone.editbone_rot
-                edit_rot_inv = edit_rot.conjugated()
-                pos = edit_rot_inv @ (pos_val - edit_trans)
+    if interpolation is not None:
+        mode = bpy.types.Keyframe.bl_rna.properties["interpolation"].enum_items[interpolation].value
+        modes = np.full(len(values), mode, dtype=np.int32)
 
-                rot = edit_rot_inv @ rot_val
+    for index in range(values.shape[1]):
+        fcurve = action.fcurves.new(data_path, index=index, action_group=group)
+        fcurve.keyframe_points.add(len(values))
+        fcurve.keyframe_points.foreach_set("co", np.column_stack((frames, values[:, index])).ravel())
+        if interpolation is not None:
+            fcurve.keyframe_points.foreach_set("interpolation", modes)
+        fcurve.update()
 
-                pbone.location = pos
-                pbone.rotation_quaternion = rot
 
-                pbone.keyframe_insert(data_path="location", frame=j)
-                pbone.keyframe_insert(data_path="rotation_quaternion", frame=j)
+def position_errors(values : np.ndarray, start : int, end : int) -> np.ndarray:
+    """Distance of the keys between start and end to their linear interpolation."""
+    t = (np.arange(start + 1, end) - start)[:, None] / (end - start)
+    interpolated = values[start] + t * (values[end] - values[start])
+    return np.linalg.norm(values[start + 1:end] - interpolated, axis=1)
 
-            #bpy.context.scene.frame_start = 0
-            #bpy.context.scene.frame_end = len(frame.frames) - 1
+
+def rotation_errors(values : np.ndarray, start : int, end : int) -> np.ndarray:
+    """
+    Angle between the quaternion keys between start and end and the rotation linear
+    quaternion F-curves evaluate to there, which is slerp's path at a different pace.
+    """
+    t = (np.arange(start + 1, end) - start)[:, None] / (end - start)
+    interpolated = values[start] + t * (values[end] - values[start])
+    interpolated /= np.maximum(np.linalg.norm(interpolated, axis=1, keepdims=True), 1e-12)
+    keys = values[start + 1:end]
+    keys = keys / np.maximum(np.linalg.norm(keys, axis=1, keepdims=True), 1e-12)
+    dots = np.abs(np.sum(interpolated * keys, axis=1))
+    return 2 * np.arccos(np.minimum(dots, 1.0))
+
+
+def reduce_keys(values : np.ndarray, tolerance : float, errors) -> np.ndarray:
+    """
+    Return the frames to keep of values (frames x channels) so that interpolating
+    linearly between them stays within tolerance of every dropped frame, as measured
+    by errors(values, start, end). Segments are split at their worst frame until all
+    are within tolerance. A curve that never leaves the tolerance keeps one key.
+    """
+    count = len(values)
+    if count <= 2:
+        return np.arange(count)
+
+    # Constant, measured against a segment from the first key back to itself
+    closed = np.concatenate((values, values[:1]))
+    if errors(closed, 0, count).max() <= tolerance:
+        return np.zeros(1, dtype=np.int64)
+
+    keep = np.zeros(count, dtype=bool)
+    keep[[0, -1]] = True
+    segments = [(0, count - 1)]
+    while segments:
+        start, end = segments.pop()
+        if end - start < 2:
+            continue
+
+        segment_errors = errors(values, start, end)
+        worst = int(np.argmax(segment_errors))
+        if segment_errors[worst] > tolerance:
+            split = start + 1 + worst
+            keep[split] = True
+            segments.extend(((start, split), (split, end)))
+
+    return np.flatnonzero(keep)
+
+
+def gather_skeleton(arm_obj : Object) -> Skeleton:
+    """
+    Rebuild the bone spaces create_blender_action needs from an imported armature,
+    so animations can be keyed onto it without reading its .chr again. The armature
+    keeps the bone order of the skeleton it was created from.
+    """
+    skeleton = Skeleton()
+    skeleton.blender_armature = arm_obj
+    bones = arm_obj.data.bones
+    bone_ids = {bone.name: i for i, bone in enumerate(bones)}
+    rot = Quaternion(PRETTIFY_ROTATION)
+
+    for blender_bone in bones:
+        bone = Bone()
+        bone.name = blender_bone.name
+        bone.parent_id = bone_ids[blender_bone.parent.name] if blender_bone.parent else -1
+
+        # The edit bone space relative to the parent, see create_blender_armature
+        local = blender_bone.matrix_local
+        if blender_bone.parent is not None:
+            local = blender_bone.parent.matrix_local.inverted() @ local
+        t, r, _ = local.decompose()
+        bone.editbone_trans = t
+        bone.editbone_rot = r
+
+        # solve_chr_space only prettifies the tree of the first bone
+        root = blender_bone
+        while root.parent is not None:
+            root = root.parent
+        if root == bones[0]:
+            bone.rotation_before = rot.copy()
+            if blender_bone.parent is not None:
+                bone.rotation_after = rot.conjugated()
+        skeleton.bones.append(bone)
+
+    skeleton.bone_count = len(skeleton.bones)
+    return skeleton
+
+
+def gather_o3d(objects : list[Object], bone_names : list[str] = None) -> tuple[Object3D, list[GMObject]]:
+    """
+    Collect mesh objects into an Object3D and its GMObjects, the inverse of create_scene.
+    An object named "#coll" becomes the collision mesh and a "-lodN" name suffix puts an
+    object into level of detail N. Bones are referenced by their index in bone_names,
+    the bone order of the model's .chr skeleton, or else by their armature order.
+    """
+    meshes = [
+        obj for obj in objects
+        if obj.type == "MESH" and SPECIAL_COLLECTION not in [c.name for c in obj.users_collection]
+    ]
+    gmobjects = [gather_gmobject(obj, bone_names) for obj in sorted(meshes, key=lambda obj: obj.name)]
+
+    o3d = Object3D()
+    o3d.lod = any(gmo.lod_index > 0 for gmo in gmobjects)
+    o3d.frame_count = max((len(gmo.frames) for gmo in gmobjects), default=0)
+
+    for i in range(3):
+        for j, gmo in enumerate(gmo for gmo in gmobjects if gmo.lod_index == i and not gmo.is_collision):
+            gmo.oid = j
+
+    bounds = [(gmo.bbmin, gmo.bbmax) for gmo in gmobjects if gmo.lod_index == 0 and len(gmo.vertices) > 0]
+    if len(bounds) > 0:
+        o3d.bbmin = tuple(np.min([bmin for bmin, _ in bounds], axis=0).tolist())
+        o3d.bbmax = tuple(np.max([bmax for _, bmax in bounds], axis=0).tolist())
+
+    # Objects animate over the whole model, hold the last key of shorter animations
+    for gmo in gmobjects:
+        if 0 < len(gmo.frames) < o3d.frame_count:
+            hold = np.repeat(gmo.frames[-1:], o3d.frame_count - len(gmo.frames), axis=0)
+            gmo.frames = np.concatenate((gmo.frames, hold))
+
+    return o3d, gmobjects
+
+
+def gather_gmobject(obj : Object, bone_names : list[str] = None) -> GMObject:
+    """
+    Convert a mesh object into a GMObject. Triangles are sorted into material blocks and
+    face corners are split into file vertices by position, UV and bone palette. Raises
+    ValueError if that gives more vertices than uint16 indices can address.
+    """
+    gmo = GMObject()
+    gmo.name = obj.name
+    gmo.is_collision = obj.name.startswith("#coll")
+    lod = re.search(r"-lod([1-3])$", obj.name)
+    gmo.lod_index = int(lod.group(1)) - 1 if lod and not gmo.is_collision else 0
+
+    armature = None
+    for mod in obj.modifiers:
+        if mod.type == "ARMATURE" and mod.object is not None:
+            armature = mod.object
+    if armature is not None and len(obj.vertex_groups) > 0 and not gmo.is_collision:
+        gmo.gm_type = 1
+
+    mesh = obj.data
+    mesh.calc_loop_triangles()
+    tri_loops = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+    mesh.loop_triangles.foreach_get("loops", tri_loops)
+    tri_materials = np.empty(len(mesh.loop_triangles), dtype=np.int32)
+    mesh.loop_triangles.foreach_get("material_index", tri_materials)
+
+    loop_vertices = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", loop_vertices)
+    positions = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", positions)
+    normals = np.empty(len(mesh.loops) * 3, dtype=np.float32)
+    mesh.corner_normals.foreach_get("vector", normals)
+    loop_uvs = np.zeros(len(mesh.loops) * 2, dtype=np.float32)
+    if mesh.uv_layers.active is not None:
+        mesh.uv_layers.active.data.foreach_get("uv", loop_uvs)
+    loop_uvs = loop_uvs.reshape(-1, 2)
+
+    order = np.argsort(tri_materials, kind="stable")
+    tri_loops = tri_loops.reshape(-1, 3)[order]
+    tri_materials = tri_materials[order]
+
+    if gmo.gm_type == 1:
+        vertex_bones, vertex_weights = gather_vertex_weights(obj, bone_names or armature.data.bones.keys())
+        tri_bones = vertex_bones[loop_vertices[tri_loops]]
+        tri_bones[vertex_weights[loop_vertices[tri_loops]] == 0] = -1
+        tri_bones = tri_bones.reshape(len(tri_loops), -1)
+        mesh_palette = split_bone_palettes(tri_bones)
+
+    blocks = []
+    for material_id in np.unique(tri_materials):
+        start, end = np.searchsorted(tri_materials, (material_id, material_id + 1))
+        if gmo.gm_type != 1:
+            blocks.append((start, end, int(material_id), []))
+        elif len(mesh_palette) == 1:
+            # All blocks can share one palette, which keeps vertices shared between them
+            blocks.append((start, end, int(material_id), mesh_palette[0][2]))
+        else:
+            for block_start, block_end, palette in split_bone_palettes(tri_bones[start:end]):
+                blocks.append((start + block_start, start + block_end, int(material_id), palette))
+
+    # Skinned vertices are split between blocks with different palettes
+    palettes = {}
+    tri_palettes = np.zeros(len(tri_loops), dtype=np.int64)
+    for start, end, _, palette in blocks:
+        tri_palettes[start:end] = palettes.setdefault(tuple(palette), len(palettes))
+
+    # One file vertex per distinct (palette, vertex, uv) corner. Corner normals of a vertex
+    # differ by the precision of custom normals, the first corner's normal is used
+    corner_loops = tri_loops.ravel()
+    corner_keys = np.column_stack((
+        np.repeat(tri_palettes, 3),
+        loop_vertices[corner_loops],
+        loop_uvs[corner_loops].view(np.int32),
+    ))
+    keys, first, inverse = np.unique(corner_keys, axis=0, return_index=True, return_inverse=True)
+    vertex_ids = keys[:, 1]
+    if len(keys) > MAX_VERTICES:
+        raise ValueError(
+            f"{obj.name} has {len(keys)} vertices after splitting by UV and bone palette, "
+            f"an .o3d mesh can have at most {MAX_VERTICES}"
+        )
+
+    gmo.vertices = revert_pos_array(positions.reshape(-1, 3)[vertex_ids])
+    gmo.normals = revert_pos_array(normals.reshape(-1, 3)[corner_loops[first]])
+    gmo.uvs = loop_uvs[corner_loops[first]]
+    gmo.indices = inverse.reshape(-1, 3).astype(np.uint16)
+    gmo.vertex_list, gmo.IIB = np.unique(gmo.vertices, axis=0, return_inverse=True)
+    gmo.IIB = gmo.IIB.ravel().astype(np.uint16)
+    if len(gmo.vertices) > 0:
+        gmo.bbmin = tuple(gmo.vertices.min(axis=0).tolist())
+        gmo.bbmax = tuple(gmo.vertices.max(axis=0).tolist())
+
+    if gmo.gm_type == 1:
+        gmo.weights = vertex_weights[vertex_ids]
+        gmo.bone_ids = np.zeros((len(vertex_ids), 2), dtype=np.uint16)
+        for palette, i in palettes.items():
+            in_palette = keys[:, 0] == i
+            slots = np.searchsorted(palette, vertex_bones[vertex_ids[in_palette]])
+            gmo.bone_ids[in_palette] = np.minimum(slots, max(len(palette) - 1, 0)) * 3
+        # The object palette has the fixed size of a block palette. Meshes split over several
+        # palettes leave it empty and their blocks carry the bones
+        if len(palettes) == 1:
+            gmo.used_bones = list(next(iter(palettes)))
+        gmo.used_bone_count = len(gmo.used_bones)
+
+    for slot in obj.material_slots:
+        gmo.materials.append(gather_material(slot.material))
+    gmo.opacity = any(
+        link.to_socket.name == "Alpha"
+        for slot in obj.material_slots if slot.material is not None and slot.material.node_tree is not None
+        for link in slot.material.node_tree.links
+    )
+
+    for start, end, material_id, palette in blocks:
+        block = MaterialBlock()
+        block.start_vertex = int(start) * 3
+        block.primitive_count = int(end - start)
+        block.material_id = min(material_id, max(len(gmo.materials) - 1, 0))
+        block.used_bone_count = len(palette)
+        block.used_bones = list(palette)
+        gmo.material_blocks.append(block)
+
+    # Transform, bone parents are stored without the prettify rotation of solve_chr_space
+    gmo.parent_id = -1
+    if obj.parent is not None and obj.parent.type == "ARMATURE" and obj.parent_type == "BONE":
+        names = bone_names or obj.parent.data.bones.keys()
+        gmo.parent_id = names.index(obj.parent_bone) if obj.parent_bone in names else -1
+        gmo.parent_gm_type = 2
+    if gmo.parent_id != -1:
+        t, r, s = obj.matrix_basis.decompose()
+        prettify = Quaternion((2**0.5 / 2, 2**0.5 / 2, 0, 0))
+        gmo.transform = revert_matrix(Matrix.LocRotScale(prettify @ t, prettify @ r, s))
+    else:
+        gmo.transform = revert_matrix(obj.matrix_local)
+
+    if gmo.gm_type == 0:
+        gmo.frames = gather_frames(obj)
+
+    return gmo
+
+
+def gather_vertex_weights(obj : Object, bone_names : list[str]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Return the two strongest bone influences of every vertex as indices into bone_names
+    and normalized weights. Unused slots have a weight of 0.
+    """
+    bone_ids = {name: i for i, name in enumerate(bone_names)}
+    group_bones = {group.index: bone_ids[group.name] for group in obj.vertex_groups if group.name in bone_ids}
+
+    bones = np.zeros((len(obj.data.vertices), 2), dtype=np.int64)
+    weights = np.zeros((len(obj.data.vertices), 2), dtype=np.float32)
+    for vertex in obj.data.vertices:
+        influences = sorted(
+            ((g.weight, group_bones[g.group]) for g in vertex.groups if g.group in group_bones and g.weight > 0),
+            reverse=True,
+        )[:2]
+        total = sum(weight for weight, _ in influences)
+        for slot, (weight, bone) in enumerate(influences):
+            bones[vertex.index, slot] = bone
+            weights[vertex.index, slot] = weight / total
+
+        if len(influences) == 1:
+            bones[vertex.index, 1] = bones[vertex.index, 0]
+
+    return bones, weights
+
+
+def split_bone_palettes(tri_bones : np.ndarray) -> list[tuple[int, int, list[int]]]:
+    """
+    Split consecutive triangles into runs using at most MAX_USED_BONES distinct bones.
+    tri_bones holds the bones of each triangle with -1 for unused slots. Returns
+    (start, end, sorted palette) for each run.
+    """
+    used = np.unique(tri_bones[tri_bones >= 0])
+    if len(used) <= MAX_USED_BONES:
+        return [(0, len(tri_bones), used.tolist())]
+
+    runs = []
+    start = 0
+    palette = set()
+    for i, bones in enumerate(tri_bones.tolist()):
+        bones = {bone for bone in bones if bone >= 0}
+        if len(palette | bones) > MAX_USED_BONES:
+            runs.append((start, i, sorted(palette)))
+            start = i
+            palette = set()
+        palette |= bones
+
+    runs.append((start, len(tri_bones), sorted(palette)))
+    return runs
+
+
+def gather_material(mat) -> Material:
+    material = Material()
+    if mat is None:
+        return material
+
+    # Materials are named after their texture on import, prefer the image actually used
+    material.texture_name = mat.name
+    if mat.use_nodes and mat.node_tree is not None:
+        for node in mat.node_tree.nodes:
+            if node.type == "TEX_IMAGE" and node.image is not None:
+                material.texture_name = bpy.path.basename(node.image.filepath) or node.image.name
+                break
+
+    return material
+
+
+def gather_frames(obj : Object) -> np.ndarray:
+    """
+    Sample the location and rotation keys of an object action into a (frames, 7) key array.
+    Every frame from 0 to the last key is sampled, as o3d frames start at scene frame 0.
+    """
+    action = obj.animation_data.action if obj.animation_data else None
+    if action is None:
+        return empty_frames()
+
+    curves = {
+        (fcurve.data_path, fcurve.array_index): fcurve for fcurve in action.fcurves
+        if fcurve.data_path in ("location", "rotation_quaternion")
+    }
+    if len(curves) == 0:
+        return empty_frames()
+
+    def sample(data_path, default, frame):
+        return [
+            curves[(data_path, i)].evaluate(frame) if (data_path, i) in curves else default[i]
+            for i in range(len(default))
+        ]
+
+    frame_count = int(max(fcurve.range()[1] for fcurve in curves.values())) + 1
+    frames = np.empty((frame_count, 7), dtype=np.float32)
+    for frame in range(frame_count):
+        x, y, z = sample("location", obj.location, frame)
+        frames[frame, FRAME_ROT] = revert_quat(sample("rotation_quaternion", obj.rotation_quaternion, frame))
+        frames[frame, FRAME_POS] = (x, z, y)
+
+    return frames
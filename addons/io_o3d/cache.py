@@ -0,0 +1,83 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+class ParseCache:
+    """
+    Least recently used cache of parsed files shared between imports. Entries are keyed
+    by file kind and absolute path and dropped as soon as the file's modification time or
+    size changes. The cache holds at most max_bytes worth of source files.
+    """
+    def __init__(self, max_bytes : int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict() # (kind, path) -> (stamp, size, value)
+        self.lock = threading.Lock()
+
+
+    @staticmethod
+    def key(kind : str, filepath : str):
+        return (kind, os.path.normcase(os.path.abspath(filepath)))
+
+
+    @staticmethod
+    def stamp(filepath : str):
+        stat = os.stat(filepath)
+        return (stat.st_mtime_ns, stat.st_size)
+
+
+    def lookup(self, kind : str, filepath : str):
+        """Return (found, value). Parsers may cache None, so found tells a miss apart."""
+        key = self.key(kind, filepath)
+        stamp = self.stamp(filepath)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return False, None
+            if entry[0] != stamp:
+                self._remove(key)
+                return False, None
+
+            self.entries.move_to_end(key)
+            return True, entry[2]
+
+
+    def store(self, kind : str, filepath : str, value):
+        key = self.key(kind, filepath)
+        stamp = self.stamp(filepath)
+        size = stamp[1]
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                return
+
+            self.entries[key] = (stamp, size, value)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+
+
+    def get(self, kind : str, filepath : str, load):
+        """Return the cached value for filepath, calling load(filepath) on a miss."""
+        found, value = self.lookup(kind, filepath)
+        if not found:
+            value = load(filepath)
+            self.store(kind, filepath, value)
+        return value
+
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+    def _remove(self, key):
+        _, size, _ = self.entries.pop(key)
+        self.size -= size
+
+
+# Shared by all imports in this Blender session
+parse_cache = ParseCache(256 * 1024 * 1024)
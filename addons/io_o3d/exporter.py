@@ -0,0 +1,261 @@
+import os
+import struct
+import numpy as np
+from .o3d_types import *
+from .importer import (
+    CHAR_STRUCT, INT32_STRUCT, UINT32_STRUCT, UINT16_STRUCT, FLOAT_STRUCT, VEC2_STRUCT, VEC3_STRUCT,
+    VEC4_STRUCT, TRANSFORM_STRUCT, VERTEX_DTYPE, SKIN_VERTEX_DTYPE,
+)
+
+
+# Version written by O3DWriter, the newest layout read_o3d understands
+O3D_VERSION = 22
+MAX_FORCES = 4
+
+
+class BinaryWriter:
+    """Counterpart of BinaryReader, every read_* has a write_* taking the same values."""
+    def __init__(self, file):
+        self.file = file
+
+    def write_char(self, value):
+        self.file.write(CHAR_STRUCT.pack(value))
+
+    def write_int32(self, value):
+        self.file.write(INT32_STRUCT.pack(value))
+
+    def write_uint32(self, value):
+        self.file.write(UINT32_STRUCT.pack(value))
+
+    def write_uint16(self, value):
+        self.file.write(UINT16_STRUCT.pack(value))
+
+    def write_float(self, value):
+        self.file.write(FLOAT_STRUCT.pack(value))
+
+    def write_vec2(self, value):
+        self.file.write(VEC2_STRUCT.pack(*value))
+
+    def write_vec3(self, value):
+        self.file.write(VEC3_STRUCT.pack(*value))
+
+    def write_vec4(self, value):
+        self.file.write(VEC4_STRUCT.pack(*value))
+
+    def write_quat(self, value):
+        self.file.write(VEC4_STRUCT.pack(*value))
+
+    def write_transform(self, value):
+        self.file.write(TRANSFORM_STRUCT.pack(*value))
+
+    def write_bytes(self, value):
+        self.file.write(bytes(value))
+
+    def write_string(self, value : str, length : int):
+        """Write value NUL padded or truncated to exactly length bytes."""
+        raw = value.encode("utf-8")[:length]
+        self.file.write(raw + b"\x00" * (length - len(raw)))
+
+    def write_array(self, item : struct.Struct, values):
+        """Write consecutive records of the given layout in a single write."""
+        self.file.write(b"".join(item.pack(*value) for value in values))
+
+    def write_ndarray(self, values, dtype):
+        """Write values converted to the given dtype as one contiguous block."""
+        self.file.write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+
+    def write_zeros(self, length):
+        self.file.write(bytes(length))
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+def pack_vertices(gmo : GMObject) -> np.ndarray:
+    """Interleave the vertex columns of a GMObject into the file's vertex records."""
+    skinned = gmo.gm_type == 1
+    records = np.zeros(len(gmo.vertices), dtype=SKIN_VERTEX_DTYPE if skinned else VERTEX_DTYPE)
+    if len(records) == 0:
+        return records
+
+    records["pos"] = np.asarray(gmo.vertices, dtype=np.float32).reshape(-1, 3)
+    records["normal"] = np.asarray(gmo.normals, dtype=np.float32).reshape(-1, 3)
+    uvs = np.asarray(gmo.uvs, dtype=np.float32).reshape(-1, 2)
+    records["uv"][:, 0] = uvs[:, 0]
+    records["uv"][:, 1] = 1.0 - uvs[:, 1] # flip V back
+    if skinned:
+        records["weights"] = np.asarray(gmo.weights, dtype=np.float32).reshape(-1, 2)
+        records["bone_ids"] = np.asarray(gmo.bone_ids, dtype=np.uint16).reshape(-1, 2)
+
+    return records
+
+
+def pool_size(gmobjects : list[GMObject]) -> int:
+    """Bytes of vertex, index and physique buffers the client allocates for all meshes."""
+    size = 0
+    for gmo in gmobjects:
+        if gmo.is_collision:
+            continue
+        stride = SKIN_VERTEX_DTYPE.itemsize if gmo.gm_type == 1 else VERTEX_DTYPE.itemsize
+        size += VEC3_STRUCT.size * len(gmo.vertex_list)
+        size += stride * len(gmo.vertices)
+        size += UINT16_STRUCT.size * (len(gmo.indices) * 3 + len(gmo.vertices))
+        size += INT32_STRUCT.size * len(gmo.physique_vertices)
+    return size
+
+
+class O3DWriter:
+    """Writes an Object3D and its GMObjects in the layout read by O3DFile.read_o3d."""
+    def __init__(self, filepath : str):
+        self.filepath = filepath
+
+
+    def write_o3d(self, o3d : Object3D, gmobjects : list[GMObject]):
+        print(f"Writing {self.filepath}...")
+        writer = BinaryWriter(open(self.filepath, "wb", buffering=1024 * 1024))
+
+        name = bytes(c ^ 0xcd for c in os.path.basename(self.filepath).encode("utf-8")[:255])
+        writer.write_char(len(name))
+        writer.write_bytes(name)
+
+        writer.write_int32(O3D_VERSION)
+        writer.write_int32(o3d.oid)
+        forces = list(o3d.forces[:MAX_FORCES])
+        forces += [(0, 0, 0)] * (MAX_FORCES - len(forces))
+        for force in forces:
+            writer.write_vec3(force)
+
+        writer.write_float(o3d.scrl_u)
+        writer.write_float(o3d.scrl_v)
+        writer.write_zeros(16)
+
+        writer.write_vec3(o3d.bbmin)
+        writer.write_vec3(o3d.bbmax)
+
+        writer.write_float(o3d.perslerp)
+        writer.write_int32(o3d.frame_count)
+
+        writer.write_int32(len(o3d.events))
+        for event in o3d.events:
+            writer.write_vec3(event)
+
+        collision = [gmo for gmo in gmobjects if gmo.is_collision]
+        writer.write_int32(len(collision))
+        if len(collision) > 0:
+            self.write_geometry(writer, collision[0])
+
+        writer.write_int32(1 if o3d.lod else 0)
+
+        writer.write_int32(o3d.bone_count)
+        if o3d.bone_count > 0:
+            writer.write_array(TRANSFORM_STRUCT, o3d.base_bones)
+            writer.write_array(TRANSFORM_STRUCT, o3d.base_inv_bones)
+
+            if o3d.frame_count > 0:
+                self.write_TMAnimation(writer, o3d.motion)
+
+            writer.write_int32(1 if o3d.send_VS else 0)
+
+        meshes = [gmo for gmo in gmobjects if not gmo.is_collision]
+        writer.write_int32(pool_size(meshes))
+        for i in range(3 if o3d.lod else 1):
+            lod_meshes = [gmo for gmo in meshes if gmo.lod_index == i]
+            writer.write_int32(len(lod_meshes))
+
+            for gmo in lod_meshes:
+                writer.write_int32(gmo.gm_type)
+                writer.write_int32(len(gmo.used_bones))
+                writer.write_ndarray(gmo.used_bones, "<i4")
+
+                writer.write_int32(gmo.oid)
+                writer.write_int32(gmo.parent_id)
+                if gmo.parent_id != -1:
+                    writer.write_int32(gmo.parent_gm_type)
+
+                writer.write_transform(gmo.transform)
+                self.write_geometry(writer, gmo)
+
+                if gmo.gm_type == 0 and o3d.frame_count > 0:
+                    writer.write_int32(1 if len(gmo.frames) > 0 else 0)
+                    if len(gmo.frames) > 0:
+                        writer.write_ndarray(gmo.frames, "<f4")
+
+        # Motion attributes, one record per frame
+        writer.write_int32(len(o3d.attributes))
+        writer.write_ndarray(o3d.attributes, MOTION_ATTRIBUTE_DTYPE)
+
+        writer.close()
+
+
+    def write_geometry(self, writer : BinaryWriter, gmo : GMObject):
+        writer.write_vec3(gmo.bbmin)
+        writer.write_vec3(gmo.bbmax)
+
+        writer.write_int32(1 if gmo.opacity else 0)
+        writer.write_int32(1 if gmo.bump else 0)
+        writer.write_int32(1 if gmo.rigid else 0)
+
+        writer.write_zeros(28)
+
+        vertices = pack_vertices(gmo)
+        indices = np.asarray(gmo.indices, dtype="<u2").ravel()
+        writer.write_int32(len(gmo.vertex_list))
+        writer.write_int32(len(vertices))
+        writer.write_int32(len(indices) // 3)
+        writer.write_int32(len(indices))
+
+        writer.write_ndarray(gmo.vertex_list, "<f4")
+        writer.write_ndarray(vertices, vertices.dtype)
+        writer.write_ndarray(indices, "<u2")
+        writer.write_ndarray(gmo.IIB, "<u2")
+
+        writer.write_int32(1 if len(gmo.physique_vertices) > 0 else 0)
+        writer.write_ndarray(gmo.physique_vertices, "<i4")
+
+        ## Material
+
+        writer.write_int32(1 if len(gmo.materials) > 0 else 0)
+        if len(gmo.materials) > 0:
+            writer.write_int32(len(gmo.materials))
+            for mat in gmo.materials:
+                writer.write_vec4(mat.diffuse)
+                writer.write_vec4(mat.ambient)
+                writer.write_vec4(mat.specular)
+                writer.write_vec4(mat.emissive)
+                writer.write_float(mat.power)
+                texture_name_length = len(mat.texture_name.encode("utf-8")) + 1
+                writer.write_int32(texture_name_length)
+                writer.write_string(mat.texture_name, texture_name_length)
+
+        writer.write_int32(len(gmo.material_blocks))
+        for block in gmo.material_blocks:
+            writer.write_int32(block.start_vertex)
+            writer.write_int32(block.primitive_count)
+            writer.write_int32(block.material_id)
+            writer.write_uint32(block.effect)
+            writer.write_int32(block.amount)
+            writer.write_int32(block.used_bone_count)
+            used_bones = list(block.used_bones[:MAX_USED_BONES])
+            writer.write_ndarray(used_bones + [0] * (MAX_USED_BONES - len(used_bones)), "<i4")
+
+
+    def write_TMAnimation(self, writer : BinaryWriter, ani : Motion):
+        for bone in ani.bones:
+            name = bone.name.encode("utf-8")
+            writer.write_int32(len(name) + 1)
+            writer.write_string(bone.name, len(name) + 1)
+            writer.write_transform(bone.inverse_transform)
+            writer.write_transform(bone.local_transform)
+            writer.write_int32(bone.parent_id)
+
+        writer.write_int32(sum(len(bone_frame.frames) for bone_frame in ani.frames))
+
+        for bone_frame in ani.frames:
+            writer.write_int32(1 if len(bone_frame.frames) > 0 else 0)
+            if len(bone_frame.frames) > 0:
+                writer.write_ndarray(bone_frame.frames, "<f4")
+            else:
+                writer.write_transform(bone_frame.transform)
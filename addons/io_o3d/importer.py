@@ -1,11 +1,43 @@
+import copy
 import glob
-import math
+import mmap
+import multiprocessing
+import os
 import struct
+import sys
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
 from .o3d_types import *
 from .blender_control import *
+from .cache import parse_cache
+from . import profiling, sidecar
 from mathutils import Vector, Quaternion, Matrix
 
 
+# Bump whenever the parsed result changes, sidecar caches of older versions are ignored
+PARSER_VERSION = 5
+
+# Record layouts of the bulk geometry buffers
+CHAR_STRUCT = struct.Struct("B")
+INT32_STRUCT = struct.Struct("<i")
+UINT32_STRUCT = struct.Struct("<I")
+UINT16_STRUCT = struct.Struct("<H")
+FLOAT_STRUCT = struct.Struct("<f")
+VEC2_STRUCT = struct.Struct("<2f")
+VEC3_STRUCT = struct.Struct("<3f")
+VEC4_STRUCT = struct.Struct("<4f")
+TRANSFORM_STRUCT = struct.Struct("<16f")
+FACE_STRUCT = struct.Struct("<3H")
+VERTEX_STRUCT = struct.Struct("<3f3f2f") # pos, normal, uv
+SKIN_VERTEX_STRUCT = struct.Struct("<3f2f2H3f2f") # pos, weights, bone ids, normal, uv
+
+# The same vertex layouts as NumPy records, for columnar geometry
+VERTEX_DTYPE = np.dtype([("pos", "<f4", 3), ("normal", "<f4", 3), ("uv", "<f4", 2)])
+SKIN_VERTEX_DTYPE = np.dtype([
+    ("pos", "<f4", 3), ("weights", "<f4", 2), ("bone_ids", "<u2", 2), ("normal", "<f4", 3), ("uv", "<f4", 2)
+])
+
+
 class BinaryReader:
     def __init__(self, file):
         self.file = file
@@ -49,11 +81,200 @@ class BinaryReader:
         raw = self.file.read(length)
         return raw.split(b"\x00", 1)[0].decode("utf-8", errors="ignore")
 
+    def read_array(self, item : struct.Struct, count):
+        """Read count consecutive records of the given layout in a single read."""
+        return list(item.iter_unpack(self.file.read(item.size * count)))
+
+    def read_ndarray(self, dtype, count):
+        """Read count consecutive records of the given dtype as a read-only NumPy array."""
+        dtype = np.dtype(dtype)
+        return np.frombuffer(self.file.read(dtype.itemsize * count), dtype, count)
+
+    def read_raw(self, length):
+        return self.file.read(length)
+
+    def skip(self, length):
+        self.file.seek(length, 1)
+
+    def tell(self):
+        return self.file.tell()
+
+    def seek(self, offset):
+        self.file.seek(offset)
+
+    def close(self):
+        self.file.close()
+
+
+class MappedBinaryReader:
+    """
+    BinaryReader backend over a memory-mapped file. Values are unpacked in place at
+    an explicit offset cursor, so no intermediate bytes objects are created.
+    """
+    def __init__(self, file):
+        self.file = file
+        self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        self.offset = 0
+
+    def _unpack(self, item : struct.Struct):
+        values = item.unpack_from(self.view, self.offset)
+        self.offset += item.size
+        return values
+
+    def read_char(self):
+        return self._unpack(CHAR_STRUCT)[0]
+
+    def read_int32(self):
+        return self._unpack(INT32_STRUCT)[0]
+
+    def read_uint32(self):
+        return self._unpack(UINT32_STRUCT)[0]
+
+    def read_uint16(self):
+        return self._unpack(UINT16_STRUCT)[0]
+
+    def read_float(self):
+        return self._unpack(FLOAT_STRUCT)[0]
+
+    def read_vec2(self):
+        return self._unpack(VEC2_STRUCT)
+
+    def read_vec3(self):
+        return self._unpack(VEC3_STRUCT)
+
+    def read_vec4(self):
+        return self._unpack(VEC4_STRUCT)
+
+    def read_quat(self):
+        return self._unpack(VEC4_STRUCT)
+
+    def read_transform(self):
+        return self._unpack(TRANSFORM_STRUCT)
+
+    def read_bytes(self, length):
+        return tuple(self.read_raw(length))
+
+    def read_string(self, length):
+        raw = bytes(self.read_raw(length))
+        return raw.split(b"\x00", 1)[0].decode("utf-8", errors="ignore")
+
+    def read_array(self, item : struct.Struct, count):
+        """Read count consecutive records of the given layout in a single read."""
+        return list(item.iter_unpack(self.read_raw(item.size * count)))
+
+    def read_ndarray(self, dtype, count):
+        """
+        View count consecutive records of the given dtype in place. The array shares the
+        mapping, so copy what you keep before the reader is closed.
+        """
+        dtype = np.dtype(dtype)
+        return np.frombuffer(self.read_raw(dtype.itemsize * count), dtype, count)
+
+    def read_raw(self, length):
+        """Return a view of the next length bytes. Valid until the reader is closed."""
+        raw = self.view[self.offset:self.offset + length]
+        self.offset += len(raw)
+        return raw
+
+    def skip(self, length):
+        self.offset += length
+
+    def tell(self):
+        return self.offset
+
+    def seek(self, offset):
+        self.offset = offset
+
+    def close(self):
+        self.view.release()
+        self.map.close()
+        self.file.close()
+
+
+def find_skeleton(filepath : str) -> str:
+    """Return the .chr skeleton path a model uses, or an empty string if it has none."""
+    filename = os.path.basename(filepath)
+    if filename.lower().startswith("mvr"):
+        return filepath[:filepath.rfind(".")] + ".chr"
+    return ""
+
+
+def find_animations(skel_filepath : str) -> list[str]:
+    """Return the .ani files that belong to a skeleton."""
+    return glob.glob(skel_filepath[:skel_filepath.rfind(".")] + "_*.ani")
+
+
+def parse_file(kind : str, filepath : str, import_settings, use_mmap : bool, columnar : bool,
+               use_sidecar : bool = False, lazy : bool = False):
+    """
+    Parse a single model ("o3d"), skeleton ("chr") or animation ("ani") file and return
+    the parsed, picklable result. Used as the worker of O3DFile.read_model_parallel.
+    """
+    o3d_file = O3DFile(filepath, use_mmap, columnar, use_sidecar=use_sidecar, lazy=lazy)
+    if kind == "o3d":
+        o3d_file.read_o3d(import_settings)
+        return o3d_file.o3d, o3d_file.gmobjects
+    elif kind == "chr":
+        return o3d_file.parse_chr(filepath)
+    else:
+        return o3d_file.parse_ani(filepath)
+
+
+def count_parsed(kind : str, value):
+    """
+    Add what a parsed file contains to the running profiling stage. The keys carry a
+    parsed_ prefix, the scene building stages count what they create under the plain
+    names and the totals would otherwise count everything twice.
+    """
+    if value is None:
+        return
+    if kind == "o3d":
+        _, gmobjects = value
+        profiling.count("parsed_gmobjects", len(gmobjects))
+        profiling.count("parsed_vertices", sum(gmo.vertex_count for gmo in gmobjects if gmo.loaded))
+        profiling.count("parsed_faces", sum(gmo.index_count // 3 for gmo in gmobjects if gmo.loaded))
+    elif kind == "chr":
+        profiling.count("parsed_bones", len(value.bones))
+    elif kind == "ani":
+        profiling.count("parsed_keyframes", sum(len(bone_frame.frames) for bone_frame in value.frames))
+
+
+# Whether parse_executor runs its workers in processes and parsing really runs in parallel
+PROCESS_WORKERS = sys.platform.startswith("linux")
+
+
+def parse_executor(max_workers : int = None):
+    """
+    Return an executor for parse_file. Workers are forked processes on Linux, where the
+    parser modules are inherited from Blender. Elsewhere a process could not import
+    bpy and mathutils, so threads are used and only file I/O overlaps.
+    Forking is only safe from the main thread.
+    """
+    if PROCESS_WORKERS:
+        return ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context("fork"))
+    return ThreadPoolExecutor(max_workers)
+
+
+def open_reader(filepath : str, use_mmap : bool = False):
+    """Open filepath for parsing with either the buffered or the memory-mapped reader."""
+    f = open(filepath, "rb")
+    if use_mmap:
+        return MappedBinaryReader(f)
+    return BinaryReader(f)
+
 
 class O3DFile:
     """o3d file description."""
-    def __init__(self, filepath: str):
+    def __init__(self, filepath: str, use_mmap : bool = False, columnar : bool = False, use_cache : bool = False,
+                 use_sidecar : bool = False, lazy : bool = False):
         self.filepath = filepath
+        self.use_mmap = use_mmap
+        self.columnar = columnar
+        self.use_cache = use_cache
+        self.use_sidecar = use_sidecar # keep parsed models and skeletons in sidecar.py files
+        self.lazy = lazy # only decode the geometry needed_geometry selects
+        self.cancelled = False # set from another thread to stop read_model after the current file
         self.o3d : Object3D = None
         self.gmobjects : list[GMObject] = []
         self.animations : list[Motion] = []
@@ -61,22 +282,116 @@ class O3DFile:
         self.import_settings = {}
 
 
+    def read_model(self, import_settings):
+        """Read the model with its skeleton and, if enabled, all of its animations."""
+        with profiling.stage("read_o3d", self.filepath):
+            self.read_o3d(import_settings)
+            count_parsed("o3d", (self.o3d, self.gmobjects))
+
+        skel_name = find_skeleton(self.filepath)
+        if len(skel_name) > 0 and not self.cancelled:
+            with profiling.stage("read_chr", skel_name):
+                self.read_chr(skel_name)
+                count_parsed("chr", self.chr)
+
+            if import_settings["include_animations"]:
+                for ani in find_animations(skel_name):
+                    if self.cancelled:
+                        break
+                    with profiling.stage("read_ani", ani):
+                        count_parsed("ani", self.read_ani(ani))
+
+
+    def read_model_parallel(self, import_settings, max_workers : int = None):
+        """
+        Same as read_model, but the model, its skeleton and every animation are parsed
+        concurrently by parse_executor workers. Only the skeleton space setup runs here.
+        """
+        skel_name = find_skeleton(self.filepath)
+        ani_files = []
+        if len(skel_name) > 0 and import_settings["include_animations"]:
+            ani_files = find_animations(skel_name)
+
+        options = (import_settings, self.use_mmap, self.columnar, self.use_sidecar, self.lazy)
+        with profiling.stage("read_model_parallel", self.filepath), parse_executor(max_workers) as executor:
+            def submit(kind, filepath):
+                # Cached results are used as they are, everything else gets a job
+                if self.use_cache:
+                    found, value = parse_cache.lookup(kind, filepath)
+                    if found:
+                        return value
+                if kind == "chr" and self.use_sidecar:
+                    # A solved skeleton cannot be sent back by a worker, load it here
+                    value = sidecar.load(filepath, kind, PARSER_VERSION)
+                    if value is not None:
+                        if self.use_cache:
+                            parse_cache.store(kind, filepath, value)
+                        return value
+                return executor.submit(parse_file, kind, filepath, *options)
+
+            def result(kind, filepath, job):
+                if not isinstance(job, Future):
+                    return job
+                value = job.result()
+                if kind == "chr":
+                    if len(value.bones) > 0:
+                        with profiling.stage("solve_chr_space", filepath):
+                            self.solve_chr_space(value)
+                    if self.use_sidecar:
+                        sidecar.save(filepath, kind, PARSER_VERSION, value)
+                if self.use_cache:
+                    parse_cache.store(kind, filepath, value)
+                return value
+
+            o3d_job = executor.submit(parse_file, "o3d", self.filepath, *options)
+            chr_job = submit("chr", skel_name) if len(skel_name) > 0 else None
+            ani_jobs = [submit("ani", ani) for ani in ani_files]
+
+            self.import_settings = import_settings
+            self.o3d, self.gmobjects = o3d_job.result()
+            count_parsed("o3d", (self.o3d, self.gmobjects))
+
+            if chr_job is not None:
+                self.chr = result("chr", skel_name, chr_job)
+                if self.use_cache:
+                    self.chr = copy.copy(self.chr)
+                self.attach_chr_gmobjects()
+                count_parsed("chr", self.chr)
+
+            for ani_name, job in zip(ani_files, ani_jobs):
+                if self.cancelled:
+                    executor.shutdown(cancel_futures=True)
+                    break
+                ani = result("ani", ani_name, job)
+                if ani is not None:
+                    self.animations.append(ani)
+                    count_parsed("ani", ani)
+
+
     def read_o3d(self, import_settings) -> Object3D:
         print(f"Reading {self.filepath}...")
         self.import_settings = import_settings
-        f = open(self.filepath, "rb")
-        reader = BinaryReader(f)
+        if self.use_sidecar:
+            cached = sidecar.load(self.filepath, "o3d", PARSER_VERSION)
+            if cached is not None:
+                self.o3d, self.gmobjects = cached
+                # The cache is keyed by content, the model may have been copied or moved since
+                self.o3d.path = self.filepath
+                return self.o3d
+
+        reader = open_reader(self.filepath, self.use_mmap)
         self.o3d = Object3D()
         self.o3d.path = self.filepath
         
         name_len = reader.read_char()
-        name = bytearray(f.read(name_len))
+        name = bytearray(reader.read_raw(name_len))
         for i in range(name_len):
             name[i] ^= 0xcd
             
         name = name.decode("utf-8", errors="ignore")
         
         version = reader.read_int32()
+        self.o3d.version = version
         self.o3d.oid = reader.read_int32() # ID
         self.o3d.forces.append(reader.read_vec3())
         self.o3d.forces.append(reader.read_vec3())
@@ -88,7 +403,7 @@ class O3DFile:
         self.o3d.scrl_u = reader.read_float()
         self.o3d.scrl_v = reader.read_float()
         
-        f.read(16) # skip 16
+        reader.skip(16)
         
         self.o3d.bbmin = reader.read_vec3()
         self.o3d.bbmax = reader.read_vec3()
@@ -104,7 +419,7 @@ class O3DFile:
             coll_obj = GMObject()
             coll_obj.gm_type = 0
             coll_obj.is_collision = True
-            self.read_geometry(f, reader, coll_obj)
+            self.read_or_skip_geometry(reader, coll_obj)
             self.gmobjects.append(coll_obj)
 
         self.o3d.lod = reader.read_int32() != 0
@@ -150,15 +465,11 @@ class O3DFile:
                 # Transform
                 gmo.transform = reader.read_transform()
                 
-                self.read_geometry(f, reader, gmo)
+                self.read_or_skip_geometry(reader, gmo)
 
                 if gmo.gm_type == 0 and self.o3d.frame_count > 0:
                     if reader.read_int32():
-                        for _ in range(self.o3d.frame_count):
-                            anim = TMAnimation()
-                            anim.rot = reader.read_quat()
-                            anim.pos = reader.read_vec3()
-                            gmo.frames.append(anim)
+                        gmo.frames = reader.read_ndarray(("<f4", 7), self.o3d.frame_count).copy()
 
                 self.gmobjects.append(gmo)
 
@@ -166,19 +477,75 @@ class O3DFile:
         """
         if version >= 21:
             if reader.read_int32() == self.o3d.frame_count:
-                for _ in range(self.o3d.frame_count):
-                    ma = MotionAttribute()
-                    ma.type = reader.read_uint16()
-                    ma.sound_id = reader.read_int32()
-                    ma.frame = reader.read_float()
-                    self.o3d.attributes.append(ma)
+                self.o3d.attributes = reader.read_ndarray(MOTION_ATTRIBUTE_DTYPE, self.o3d.frame_count).copy()
         """
 
-        f.close()
+        reader.close()
+        # Skipped geometry would be missing from the sidecar
+        if self.use_sidecar and all(gmo.loaded for gmo in self.gmobjects):
+            sidecar.save(self.filepath, "o3d", PARSER_VERSION, (self.o3d, self.gmobjects))
         return self.o3d
     
 
-    def read_geometry(self, f, reader: BinaryReader, gmo : GMObject):
+    def needed_geometry(self, gmo : GMObject) -> bool:
+        """Whether a lazy read decodes the geometry of gmo, which is everything not hidden."""
+        if gmo.is_collision:
+            return not self.import_settings["hide_coll"]
+        return gmo.lod_index == 0 or not self.import_settings["hide_lod"]
+
+
+    def read_or_skip_geometry(self, reader: BinaryReader, gmo : GMObject):
+        gmo.geometry_offset = reader.tell()
+        if not self.lazy or self.needed_geometry(gmo):
+            self.read_geometry(reader, gmo)
+        else:
+            self.skip_geometry(reader, gmo)
+
+
+    def skip_geometry(self, reader: BinaryReader, gmo : GMObject):
+        """
+        Read only the bounds, counts and materials of a geometry block and seek past its
+        buffers. load_gmobject reads the rest.
+        """
+        gmo.loaded = False
+        gmo.bbmin = reader.read_vec3()
+        gmo.bbmax = reader.read_vec3()
+
+        reader.skip(3 * INT32_STRUCT.size + 28)
+
+        gmo.vertex_list_count = reader.read_int32()
+        gmo.vertex_count = reader.read_int32()
+        gmo.face_list_count = reader.read_int32()
+        gmo.index_count = reader.read_int32()
+
+        layout = SKIN_VERTEX_STRUCT if gmo.gm_type == 1 else VERTEX_STRUCT
+        reader.skip(
+            VEC3_STRUCT.size * gmo.vertex_list_count
+            + layout.size * gmo.vertex_count
+            + FACE_STRUCT.size * ((gmo.index_count + 2) // 3)
+            + UINT16_STRUCT.size * gmo.vertex_count
+        )
+        if reader.read_int32() > 0:
+            reader.skip(INT32_STRUCT.size * gmo.vertex_list_count)
+
+        self.read_materials(reader, gmo)
+
+
+    def load_gmobject(self, gmo : GMObject):
+        """Read the geometry of a GMObject a lazy read_o3d skipped."""
+        if gmo.loaded:
+            return
+
+        reader = open_reader(self.filepath, self.use_mmap)
+        reader.seek(gmo.geometry_offset)
+        gmo.materials = [] # read again with the rest
+        gmo.material_blocks = []
+        self.read_geometry(reader, gmo)
+        reader.close()
+        gmo.loaded = True
+
+
+    def read_geometry(self, reader: BinaryReader, gmo : GMObject):
         gmo.bbmin = reader.read_vec3()
         gmo.bbmax = reader.read_vec3()
         
@@ -186,53 +553,25 @@ class O3DFile:
         gmo.bump = reader.read_int32() != 0
         gmo.rigid = reader.read_int32() != 0
         
-        f.read(28) # skip
+        reader.skip(28)
         
         gmo.vertex_list_count = reader.read_int32()
         gmo.vertex_count = reader.read_int32()
         gmo.face_list_count = reader.read_int32()
         gmo.index_count = reader.read_int32()
-        
-        for _ in range(gmo.vertex_list_count):
-            gmo.vertex_list.append(reader.read_vec3())
-            
+
         self.o3d.has_skin = gmo.gm_type == 1
 
-        for _ in range(gmo.vertex_count):
-            pos = reader.read_vec3()
-            if self.o3d.has_skin:
-                w1 = reader.read_float()
-                w2 = reader.read_float()
-                id1 = reader.read_uint16()
-                id2 = reader.read_uint16()
-                
-                gmo.weights.append((w1, w2))
-                gmo.bone_ids.append((id1, id2))
+        if self.columnar:
+            self.read_geometry_arrays(reader, gmo)
+        else:
+            self.read_geometry_lists(reader, gmo)
 
-            normal = reader.read_vec3()
-            uv = reader.read_vec2()
+        self.read_materials(reader, gmo)
 
-            uvl = list(uv)
-            uvl[1] = -uvl[1] + 1.0
-            uv = tuple(uvl)
-
-            gmo.vertices.append(pos)
-            gmo.normals.append(normal)
-            gmo.uvs.append(uv)
-            
-        for _ in range(0, gmo.index_count, 3):
-            face = (reader.read_uint16(), reader.read_uint16(), reader.read_uint16())
-            gmo.indices.append(face)
-        
-        for _ in range(gmo.vertex_count):
-            gmo.IIB.append(reader.read_uint16())
-            
-        if reader.read_int32() > 0:
-            for _ in range(gmo.vertex_list_count):
-                gmo.physique_vertices.append(reader.read_int32())
-
-        ## Material
 
+    def read_materials(self, reader: BinaryReader, gmo : GMObject):
+        """Read the materials and material blocks that follow the geometry buffers."""
         gmo.material = reader.read_int32() != 0
         if gmo.material:
             gmo.material_count = reader.read_int32()
@@ -260,26 +599,97 @@ class O3DFile:
             block.effect = reader.read_uint32()
             block.amount = reader.read_int32()
             block.used_bone_count = reader.read_int32()
-            for _ in range(28):
-                block.used_bones.append(reader.read_int32())
+            block.used_bones = [i for i, in reader.read_array(INT32_STRUCT, 28)]
 
             gmo.material_blocks.append(block)
 
 
+    def read_geometry_lists(self, reader: BinaryReader, gmo : GMObject):
+        gmo.vertex_list = reader.read_array(VEC3_STRUCT, gmo.vertex_list_count)
+
+        layout = SKIN_VERTEX_STRUCT if self.o3d.has_skin else VERTEX_STRUCT
+        columns = list(zip(*reader.read_array(layout, gmo.vertex_count))) or [()] * 12
+        gmo.vertices = list(zip(*columns[0:3]))
+        if self.o3d.has_skin:
+            gmo.weights = list(zip(*columns[3:5]))
+            gmo.bone_ids = list(zip(*columns[5:7]))
+            columns = columns[7:]
+        else:
+            columns = columns[3:]
+
+        gmo.normals = list(zip(*columns[0:3]))
+        gmo.uvs = list(zip(columns[3], [1.0 - v for v in columns[4]])) # flip V
+
+        gmo.indices = reader.read_array(FACE_STRUCT, (gmo.index_count + 2) // 3)
+        gmo.IIB = [i for i, in reader.read_array(UINT16_STRUCT, gmo.vertex_count)]
+
+        if reader.read_int32() > 0:
+            gmo.physique_vertices = [i for i, in reader.read_array(INT32_STRUCT, gmo.vertex_list_count)]
+
+
+    def read_geometry_arrays(self, reader: BinaryReader, gmo : GMObject):
+        """Decode the geometry buffers straight into contiguous NumPy arrays."""
+        gmo.vertex_list = reader.read_ndarray(("<f4", 3), gmo.vertex_list_count).copy()
+
+        layout = SKIN_VERTEX_DTYPE if self.o3d.has_skin else VERTEX_DTYPE
+        records = reader.read_ndarray(layout, gmo.vertex_count)
+        gmo.vertices = records["pos"].copy()
+        if self.o3d.has_skin:
+            gmo.weights = records["weights"].copy()
+            gmo.bone_ids = records["bone_ids"].copy()
+
+        gmo.normals = records["normal"].copy()
+        gmo.uvs = records["uv"].copy()
+        gmo.uvs[:, 1] = 1.0 - gmo.uvs[:, 1] # flip V
+        del records
+
+        gmo.indices = reader.read_ndarray(("<u2", 3), (gmo.index_count + 2) // 3).copy()
+        gmo.IIB = reader.read_ndarray("<u2", gmo.vertex_count).copy()
+
+        if reader.read_int32() > 0:
+            gmo.physique_vertices = reader.read_ndarray("<i4", gmo.vertex_list_count).copy()
+
+
     def read_chr(self, chr_filepath : str):
-        f = open(chr_filepath, "rb")
-        reader = BinaryReader(f)
-        self.chr = Skeleton()
+        if self.use_cache:
+            # Bones are shared with other imports, the skeleton object is not
+            self.chr = copy.copy(parse_cache.get("chr", chr_filepath, self.load_chr))
+        else:
+            self.chr = self.load_chr(chr_filepath)
+        self.attach_chr_gmobjects()
+
+
+    def load_chr(self, chr_filepath : str) -> Skeleton:
+        """Read a .chr skeleton and solve its coordinate space."""
+        if self.use_sidecar:
+            skeleton = sidecar.load(chr_filepath, "chr", PARSER_VERSION)
+            if skeleton is not None:
+                return skeleton
+
+        skeleton = self.parse_chr(chr_filepath)
+        if len(skeleton.bones) > 0:
+            with profiling.stage("solve_chr_space", chr_filepath):
+                self.solve_chr_space(skeleton)
+        if self.use_sidecar:
+            sidecar.save(chr_filepath, "chr", PARSER_VERSION, skeleton)
+        return skeleton
+
+
+    def parse_chr(self, chr_filepath : str) -> Skeleton:
+        """Read a .chr skeleton without solving its coordinate space."""
+        reader = open_reader(chr_filepath, self.use_mmap)
+        skeleton = Skeleton()
 
         version = reader.read_int32()
         if version < 4:
             print("Skeleton version is no longer supported")
-            return
+            reader.close()
+            return skeleton
         
-        self.chr.oid = reader.read_int32()
-        self.chr.bone_count = reader.read_int32()
+        skeleton.oid = reader.read_int32()
+        skeleton.bone_count = reader.read_int32()
 
-        for _ in range(self.chr.bone_count):
+        for _ in range(skeleton.bone_count):
             bone = Bone()
             name_len = reader.read_int32()
             bone.name = reader.read_string(name_len)
@@ -287,49 +697,46 @@ class O3DFile:
             bone.inverse_transform = reader.read_transform()
             bone.local_transform = reader.read_transform()
             bone.parent_id = reader.read_int32()
-            self.chr.bones.append(bone)
+            skeleton.bones.append(bone)
 
-        for bone in self.chr.bones:
+        for bone in skeleton.bones:
             if bone.parent_id != -1:
-                self.chr.bones[bone.parent_id].children.append(bone)
+                skeleton.bones[bone.parent_id].children.append(bone)
 
-        for gmo in self.gmobjects:
-            if gmo.parent_id != -1 and gmo.parent_gm_type == 2:
-                self.chr.bones[gmo.parent_id].children_gmos.append(gmo)
-
-        ### Coordinate space stuff
-        for bone in self.chr.bones:
-            bone.base_trs = convert_matrix(bone.local_transform).decompose()
-        
-        self.chr.send_VS = reader.read_int32() != 0
-        self.chr.local_RH = reader.read_transform()
-        self.chr.local_shield = reader.read_transform()
-        self.chr.local_knuckle = reader.read_transform()
+        skeleton.send_VS = reader.read_int32() != 0
+        skeleton.local_RH = reader.read_transform()
+        skeleton.local_shield = reader.read_transform()
+        skeleton.local_knuckle = reader.read_transform()
 
         if version == 5:
             for _ in range(4):
-                self.chr.events.append(reader.read_vec3())
-                self.chr.event_parent_ids.append(reader.read_int32())
+                skeleton.events.append(reader.read_vec3())
+                skeleton.event_parent_ids.append(reader.read_int32())
         elif version >= 6:
             for _ in range(8):
-                self.chr.events.append(reader.read_vec3())
-                self.chr.event_parent_ids.append(reader.read_int32())
+                skeleton.events.append(reader.read_vec3())
+                skeleton.event_parent_ids.append(reader.read_int32())
 
         if version == 7:
-            self.chr.local_LH = reader.read_transform()
+            skeleton.local_LH = reader.read_transform()
 
-        f.close()
-        self.setup_chr_space()
+        reader.close()
+        return skeleton
 
 
-    def setup_chr_space(self):
-        for bone in self.chr.bones:
+    def solve_chr_space(self, skeleton : Skeleton):
+        """Solve the edit and pose space of every bone. Depends on nothing but the skeleton."""
+        ### Coordinate space stuff
+        for bone in skeleton.bones:
+            bone.base_trs = convert_matrix(bone.local_transform).decompose()
+
+        for bone in skeleton.bones:
             bone.editbone_trans = Vector(bone.base_trs[0])
             bone.editbone_rot = Quaternion(bone.base_trs[1])
 
         # Prettify
         def rotate_bone(bone: Bone):
-            rot = Quaternion((2**0.5 / 2, 2**0.5 / 2, 0, 0))
+            rot = Quaternion(PRETTIFY_ROTATION)
             # rotate_edit_bone
             bone.editbone_rot @= rot
             rot_inv = rot.conjugated()
@@ -342,18 +749,15 @@ class O3DFile:
             for child in bone.children:
                 child.rotation_after = rot_inv @ child.rotation_after
 
-            for child_gmo in bone.children_gmos:
-                child_gmo.rotation_after = rot_inv @ child_gmo.rotation_after
-
             for child in bone.children:
                 rotate_bone(child)
 
-        rotate_bone(self.chr.bones[0])
+        rotate_bone(skeleton.bones[0])
 
         # Calc matrices
         def calc_matrices(bone: Bone):
             if bone.parent_id != -1:
-                parent_editbone_mat = self.chr.bones[bone.parent_id].editbone_arma_mat
+                parent_editbone_mat = skeleton.bones[bone.parent_id].editbone_arma_mat
             else:
                 parent_editbone_mat = Matrix.Identity(4)
 
@@ -364,24 +768,45 @@ class O3DFile:
             for child in bone.children:
                 calc_matrices(child)
 
-        calc_matrices(self.chr.bones[0])
+        calc_matrices(skeleton.bones[0])
+
+
+    def attach_chr_gmobjects(self):
+        """Apply the prettify rotation of a bone to the GMObjects parented to it."""
+        if len(self.chr.bones) == 0:
+            return
+
+        for gmo in self.gmobjects:
+            if gmo.parent_id != -1 and gmo.parent_gm_type == 2:
+                bone = self.chr.bones[gmo.parent_id]
+                gmo.rotation_after = bone.rotation_before.conjugated() @ gmo.rotation_after
 
 
     def read_ani(self, ani_filepath : str) -> Motion:
-        f = open(ani_filepath, "rb")
-        reader = BinaryReader(f)
+        if self.use_cache:
+            ani = parse_cache.get("ani", ani_filepath, self.parse_ani)
+        else:
+            ani = self.parse_ani(ani_filepath)
+        if ani is not None:
+            self.animations.append(ani)
+        return ani
+
+
+    def parse_ani(self, ani_filepath : str) -> Motion:
+        """Read an .ani animation without adding it to this file's animations."""
+        reader = open_reader(ani_filepath, self.use_mmap)
         ani = Motion()
 
         version = reader.read_int32()
         if version < 10:
             print("Animation is not supported on this version")
-            f.close()
+            reader.close()
             return
         
         ani.oid = reader.read_int32()
         ani.perslerp = reader.read_float()
 
-        f.read(32) # Skip 32
+        reader.skip(32)
 
         ani.bone_count = reader.read_int32()
         ani.frame_count = reader.read_int32()
@@ -392,21 +817,15 @@ class O3DFile:
 
         self.read_TMAnimation(reader, ani, ani.bone_count, ani.frame_count)
 
-        for _ in range(ani.frame_count):
-            ma = MotionAttribute()
-            ma.type = reader.read_uint16()
-            ma.sound_id = reader.read_int32()
-            ma.frame = reader.read_float()
-            ani.attributes.append(ma)
+        ani.attributes = reader.read_ndarray(MOTION_ATTRIBUTE_DTYPE, ani.frame_count).copy()
 
         ani.event_count = reader.read_int32()
         for _ in range(ani.event_count):
             ani.events.append(reader.read_vec3())
 
         ani.name = ani_filepath[ani_filepath.rfind("_")+1:-4]
-        self.animations.append(ani)
 
-        f.close()
+        reader.close()
         return ani
     
 
@@ -433,11 +852,8 @@ class O3DFile:
             bone_frame = BoneFrame()
 
             if reader.read_int32() != 0:
-                for _ in range(ani.frame_count):
-                    anim = TMAnimation()
-                    anim.rot = reader.read_quat()
-                    anim.pos = reader.read_vec3()
-                    bone_frame.frames.append(anim)
+                # One block of (rotation, position) keys per animated bone
+                bone_frame.frames = reader.read_ndarray(("<f4", 7), ani.frame_count).copy()
             else:
                 bone_frame.transform = reader.read_transform()
             
@@ -1,8 +1,62 @@
 import bpy
+import numpy as np
 from bpy.types import Object
 from mathutils import Vector, Quaternion, Matrix
 
+MAX_USED_BONES = 28 # bone palette slots of a skinned material block
+MAX_VERTICES = 0xffff # indices are uint16
+
+# Animation keys are (frames, 7) float32 arrays, each row the rotation quaternion
+# (x, y, z, w) followed by the position (x, y, z), as stored in the files
+FRAME_ROT = slice(0, 4)
+FRAME_POS = slice(4, 7)
+
+def empty_frames() -> np.ndarray:
+    return np.zeros((0, 7), dtype=np.float32)
+
+# Motion attributes are structured arrays with one record per frame, in the file layout
+MOTION_ATTRIBUTE_DTYPE = np.dtype([("type", "<u2"), ("sound_id", "<i4"), ("frame", "<f4")])
+
+def empty_attributes() -> np.ndarray:
+    return np.zeros(0, dtype=MOTION_ATTRIBUTE_DTYPE)
+
+
+class LazyMath:
+    """
+    Field holding a mathutils value that is only created when it is first read, so
+    bones and objects that never reach the scene code do not allocate one. The value
+    lives in the slot of the same name with a leading underscore, None until created.
+    """
+    def __init__(self, default):
+        self.default = default
+
+    def __set_name__(self, owner, name):
+        self.slot = "_" + name
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        value = getattr(obj, self.slot)
+        if value is None:
+            value = self.default()
+            setattr(obj, self.slot, value)
+        return value
+
+    def __set__(self, obj, value):
+        setattr(obj, self.slot, value)
+
+
+def fields(obj) -> dict:
+    """The fields of a model object by name, what vars() returns for a class without slots."""
+    return {name.lstrip("_"): getattr(obj, name.lstrip("_")) for name in obj.__slots__}
+
+
 class Skeleton:
+    __slots__ = (
+        "oid", "bone_count", "bones", "send_VS", "local_RH", "local_LH", "local_shield",
+        "local_knuckle", "events", "event_parent_ids", "blender_armature",
+    )
+
     def __init__(self):
         self.oid = 0
         self.bone_count = 0
@@ -18,12 +72,44 @@ class Skeleton:
 
 
 class TMAnimation:
-    def __init__(self):
-        self.rot = (0, 0, 0, 0) # its a quaternion
-        self.pos = (0, 0, 0)
+    """View of one key in a (frames, 7) key array."""
+    __slots__ = ("frames", "index")
+
+    def __init__(self, frames : np.ndarray = None, index : int = 0):
+        self.frames = frames if frames is not None else np.zeros((1, 7), dtype=np.float32)
+        self.index = index
+
+    @property
+    def rot(self) -> tuple: # its a quaternion
+        return tuple(self.frames[self.index, FRAME_ROT].tolist())
+
+    @rot.setter
+    def rot(self, value):
+        self.frames[self.index, FRAME_ROT] = value
+
+    @property
+    def pos(self) -> tuple:
+        return tuple(self.frames[self.index, FRAME_POS].tolist())
+
+    @pos.setter
+    def pos(self, value):
+        self.frames[self.index, FRAME_POS] = value
 
 
 class Bone:
+    __slots__ = (
+        "parent_id", "name", "local_transform", "transform", "inverse_transform", "blender_bone",
+        "children", "_base_trs", "_editbone_arma_mat", "_rotation_before", "_rotation_after",
+        "_editbone_trans", "_editbone_rot", "pose_conversion",
+    )
+
+    base_trs = LazyMath(lambda: (Vector((0, 0, 0)), Quaternion((1, 0, 0, 0)), Vector((1, 1, 1))))
+    editbone_arma_mat = LazyMath(lambda: Matrix.Identity(4))
+    rotation_before = LazyMath(lambda: Quaternion((1, 0, 0, 0)))
+    rotation_after = LazyMath(lambda: Quaternion((1, 0, 0, 0)))
+    editbone_trans = LazyMath(lambda: Vector((0, 0, 0)))
+    editbone_rot = LazyMath(lambda: Quaternion((1, 0, 0, 0)))
+
     def __init__(self):
         self.parent_id = 0
         self.name = ""
@@ -33,33 +119,77 @@ class Bone:
 
         self.blender_bone : bpy.types.EditBone = None
         self.children : list[Bone] = []
-        self.children_gmos : list[GMObject] = []
-        self.base_trs = (
-            Vector((0, 0, 0)),
-            Quaternion((1, 0, 0, 0)),
-            Vector((1, 1, 1)),
-        )
-        self.editbone_arma_mat = Matrix.Identity(4)
-        self.rotation_before = Quaternion((1, 0, 0, 0))
-        self.rotation_after = Quaternion((1, 0, 0, 0))
-        self.editbone_trans = Vector((0, 0, 0))
-        self.editbone_rot = Quaternion((1, 0, 0, 0))
+        self._base_trs = None
+        self._editbone_arma_mat = None
+        self._rotation_before = None
+        self._rotation_after = None
+        self._editbone_trans = None
+        self._editbone_rot = None
+        self.pose_conversion = None # cached (location, rotation) matrices for animation keys
+
+    # Fields holding Blender or mathutils objects, which cannot be pickled. They are
+    # derived from the parsed data after loading, so they start from their defaults.
+    _unpicklable = (
+        "blender_bone", "base_trs", "editbone_arma_mat", "rotation_before", "rotation_after",
+        "editbone_trans", "editbone_rot", "pose_conversion",
+    )
+
+    def __getstate__(self):
+        return {k: getattr(self, k) for k in self.__slots__ if k.lstrip("_") not in self._unpicklable}
+
+    def __setstate__(self, state):
+        self.__init__()
+        for k, v in state.items():
+            setattr(self, k, v)
 
 
 class BoneFrame:
+    __slots__ = ("frames", "transform")
+
     def __init__(self):
-        self.frames : list[TMAnimation] = []
+        self.frames : np.ndarray = empty_frames()
         self.transform = []
 
 
 class MotionAttribute:
-    def __init__(self):
-        self.type = 0
-        self.sound_id = 0
-        self.frame = 0
+    """View of one record in a MOTION_ATTRIBUTE_DTYPE array."""
+    __slots__ = ("attributes", "index")
+
+    def __init__(self, attributes : np.ndarray = None, index : int = 0):
+        self.attributes = attributes if attributes is not None else np.zeros(1, dtype=MOTION_ATTRIBUTE_DTYPE)
+        self.index = index
+
+    @property
+    def type(self) -> int:
+        return int(self.attributes["type"][self.index])
+
+    @type.setter
+    def type(self, value):
+        self.attributes["type"][self.index] = value
+
+    @property
+    def sound_id(self) -> int:
+        return int(self.attributes["sound_id"][self.index])
+
+    @sound_id.setter
+    def sound_id(self, value):
+        self.attributes["sound_id"][self.index] = value
+
+    @property
+    def frame(self) -> float:
+        return float(self.attributes["frame"][self.index])
+
+    @frame.setter
+    def frame(self, value):
+        self.attributes["frame"][self.index] = value
 
 
 class Motion:
+    __slots__ = (
+        "name", "oid", "perslerp", "bone_count", "frame_count", "event_count", "paths", "events",
+        "attributes", "bones", "animations", "frames",
+    )
+
     def __init__(self):
         self.name = ""
         self.oid = 0
@@ -69,13 +199,15 @@ class Motion:
         self.event_count = 0
         self.paths = []
         self.events = []
-        self.attributes : list[MotionAttribute] = []
+        self.attributes : np.ndarray = empty_attributes()
         self.bones : list[Bone] = []
         self.animations : list[TMAnimation] = []
         self.frames : list[BoneFrame] = []
 
 
 class Material:
+    __slots__ = ("texture_name", "diffuse", "ambient", "specular", "emissive", "power")
+
     def __init__(self):
         self.texture_name = ""
         self.diffuse = (1, 1, 1, 1)
@@ -86,6 +218,10 @@ class Material:
 
 
 class MaterialBlock:
+    __slots__ = (
+        "start_vertex", "primitive_count", "material_id", "amount", "used_bone_count", "effect", "used_bones",
+    )
+
     def __init__(self):
         self.start_vertex = 0
         self.primitive_count = 0
@@ -97,11 +233,18 @@ class MaterialBlock:
 
 
 class Object3D:
+    __slots__ = (
+        "path", "version", "oid", "motion", "attributes", "forces", "bbmin", "bbmax", "scrl_u",
+        "scrl_v", "perslerp", "frame_count", "event_count", "bone_count", "events", "lod", "send_VS",
+        "coll_obj", "base_bones", "base_inv_bones", "groups", "has_skin",
+    )
+
     def __init__(self):
         self.path = ""
+        self.version = 0
         self.oid = 0
         self.motion : Motion = None
-        self.attributes : list[MotionAttribute] = []
+        self.attributes : np.ndarray = empty_attributes()
         self.forces = []
         self.bbmin = (0, 0, 0)
         self.bbmax = (0, 0, 0)
@@ -122,6 +265,19 @@ class Object3D:
 
 
 class GMObject:
+    __slots__ = (
+        "name", "lod_index", "oid", "parent_id", "gm_type", "parent_gm_type", "used_bone_count",
+        "bbmin", "bbmax", "vertex_list_count", "vertex_count", "face_list_count", "index_count",
+        "material_count", "material_block_count", "vertex_list", "vertices", "normals", "uvs",
+        "weights", "bone_ids", "indices", "IIB", "used_bones", "physique_vertices", "materials",
+        "material_blocks", "transform", "frames", "material", "opacity", "bump", "rigid",
+        "is_collision", "loaded", "geometry_offset", "blender_obj", "_rotation_before",
+        "_rotation_after",
+    )
+
+    rotation_before = LazyMath(lambda: Quaternion((1, 0, 0, 0)))
+    rotation_after = LazyMath(lambda: Quaternion((1, 0, 0, 0)))
+
     def __init__(self):
         self.name = ""
         self.lod_index = 0
@@ -151,12 +307,25 @@ class GMObject:
         self.materials : list[Material] = []
         self.material_blocks : list[MaterialBlock] = []
         self.transform = []
-        self.frames : list[TMAnimation] = []
+        self.frames : np.ndarray = empty_frames()
         self.material = False
         self.opacity = False
         self.bump = False
         self.rigid = False
         self.is_collision = False
+        self.loaded = True # False while a lazy read skipped the geometry
+        self.geometry_offset = -1 # file offset of the geometry, for loading it later
         self.blender_obj : Object = None
-        self.rotation_before = Quaternion((1, 0, 0, 0))
-        self.rotation_after = Quaternion((1, 0, 0, 0))
\ No newline at end of file
+        self._rotation_before = None
+        self._rotation_after = None
+
+    # See Bone._unpicklable
+    _unpicklable = ("blender_obj", "rotation_before", "rotation_after")
+
+    def __getstate__(self):
+        return {k: getattr(self, k) for k in self.__slots__ if k.lstrip("_") not in self._unpicklable}
+
+    def __setstate__(self, state):
+        self.__init__()
+        for k, v in state.items():
+            setattr(self, k, v)
\ No newline at end of file
@@ -0,0 +1,170 @@
+"""
+Per-stage timing of imports.
+
+Stages are the parsing and scene building steps, like read_o3d or create_blender_mesh.
+While an ImportProfile is active, every stage records its wall time and what it
+processed (vertices, faces, bones, keyframes, vertex group adds, ...). Stages nest, a
+count goes to the innermost running stage and the time of a stage includes the stages
+it runs. Without an active profile the instrumentation does nothing. A profile is
+active only in the thread that entered it, so a background import does not pick up
+the work of the main thread.
+
+    profile = ImportProfile(use_cprofile=True)
+    with profile:
+        o3d_file.read_model(import_settings)
+        create_scene(o3d_file)
+    profile.write("report.json")
+"""
+import cProfile
+import functools
+import json
+import pstats
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+REPORT_VERSION = 1
+
+
+class ImportProfile:
+    def __init__(self, name : str = "", use_cprofile : bool = False, cprofile_limit : int = 40):
+        self.name = name
+        self.events = [] # one per finished stage run
+        self.totals = Counter()
+        self.stack = [] # counts of the running stages
+        self.seconds = 0.0
+        self.cprofile_limit = cprofile_limit
+        self.profiler = cProfile.Profile() if use_cprofile else None
+        self.previous = None
+        self.start = 0.0
+
+
+    def __enter__(self):
+        self.previous, _state.active = current(), self
+        self.start = time.perf_counter()
+        if self.profiler is not None:
+            self.profiler.enable()
+        return self
+
+
+    def __exit__(self, *exc):
+        if self.profiler is not None:
+            self.profiler.disable()
+        self.seconds += time.perf_counter() - self.start
+        _state.active = self.previous
+        return False
+
+
+    @contextmanager
+    def stage(self, name : str, item : str = ""):
+        counts = Counter()
+        self.stack.append(counts)
+        start = time.perf_counter()
+        try:
+            yield counts
+        finally:
+            self.stack.pop()
+            self.events.append({
+                "stage": name,
+                "item": item,
+                "seconds": time.perf_counter() - start,
+                "counts": dict(counts),
+            })
+
+
+    def count(self, key : str, amount : int = 1):
+        amount = int(amount) # NumPy integers are not JSON serializable
+        if self.stack:
+            self.stack[-1][key] += amount
+        self.totals[key] += amount
+
+
+    def stages(self) -> dict:
+        """Calls, total seconds and summed counts of every stage, slowest first."""
+        stages = {}
+        for event in self.events:
+            stage = stages.setdefault(event["stage"], {"calls": 0, "seconds": 0.0, "counts": Counter()})
+            stage["calls"] += 1
+            stage["seconds"] += event["seconds"]
+            stage["counts"].update(event["counts"])
+
+        ordered = sorted(stages.items(), key=lambda item: item[1]["seconds"], reverse=True)
+        return {name: dict(stage, counts=dict(stage["counts"])) for name, stage in ordered}
+
+
+    def top_functions(self) -> list[dict]:
+        """The functions with the most cumulative time in the cProfile capture."""
+        if self.profiler is None:
+            return []
+
+        stats = pstats.Stats(self.profiler).stats
+        rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:self.cprofile_limit]
+        return [{
+            "function": f"{file}:{line}({function})",
+            "calls": calls,
+            "own_seconds": own,
+            "cumulative_seconds": cumulative,
+        } for (file, line, function), (_, calls, own, cumulative, _) in rows]
+
+
+    def report(self) -> dict:
+        return {
+            "version": REPORT_VERSION,
+            "name": self.name,
+            "seconds": self.seconds,
+            "counts": dict(self.totals),
+            "stages": self.stages(),
+            "events": self.events,
+            "cprofile": self.top_functions(),
+        }
+
+
+    def write(self, filepath : str):
+        with open(filepath, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+
+    def summary(self) -> str:
+        lines = [f"Profile {self.name}: {self.seconds:.3f}s"]
+        for name, stage in self.stages().items():
+            counts = ", ".join(f"{key} {value}" for key, value in sorted(stage["counts"].items()))
+            lines.append(f"  {name:28} {stage['calls']:5}x {stage['seconds']:9.3f}s  {counts}")
+        return "\n".join(lines)
+
+
+# Per thread, the profile receiving the stages while an ImportProfile is entered
+_state = threading.local()
+
+
+def current() -> ImportProfile:
+    """The profile active in the calling thread, or None."""
+    return getattr(_state, "active", None)
+
+
+def stage(name : str, item : str = ""):
+    """Context manager timing a stage of the active profile, yields its counts."""
+    active = current()
+    if active is None:
+        return nullcontext(Counter())
+    return active.stage(name, item)
+
+
+def count(key : str, amount : int = 1):
+    active = current()
+    if active is not None:
+        active.count(key, amount)
+
+
+def timed(name : str):
+    """Decorator running every call of the function as a stage."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            active = current()
+            if active is None:
+                return func(*args, **kwargs)
+            with active.stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
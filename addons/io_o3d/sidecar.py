@@ -0,0 +1,209 @@
+"""
+Persistent cache of parsed files, stored as a sidecar next to the source file.
+
+A sidecar is a small header, a JSON description of the parsed objects and the raw
+NumPy array blobs they reference:
+
+    magic "O3DC" | format version (uint32) | description length (uint32) | description | blobs
+
+Blobs are aligned and loaded as read-only views into a memory map, so a warm load
+only decodes the description. The description records the SHA-256 of the source file
+and the parser version, a sidecar that matches neither is ignored and rewritten.
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import numpy as np
+from .o3d_types import *
+
+
+MAGIC = b"O3DC"
+FORMAT_VERSION = 1
+HEADER_STRUCT = struct.Struct("<4sII")
+ALIGNMENT = 16
+SUFFIX = ".cache"
+
+# Fields that reference Blender data or are recomputed per import
+TRANSIENT = {
+    "Skeleton": ("blender_armature",),
+    "Bone": ("blender_bone", "pose_conversion"),
+    "GMObject": ("blender_obj",),
+}
+
+# Geometry stored as blobs, with the dtype used when it was parsed into lists
+GMO_ARRAYS = {
+    "vertex_list": ("<f4", 3),
+    "vertices": ("<f4", 3),
+    "normals": ("<f4", 3),
+    "uvs": ("<f4", 2),
+    "weights": ("<f4", 2),
+    "bone_ids": ("<u2", 2),
+    "indices": ("<u2", 3),
+    "IIB": "<u2",
+    "physique_vertices": "<i4",
+}
+
+TYPES = {cls.__name__: cls for cls in (
+    Skeleton, TMAnimation, Bone, BoneFrame, MotionAttribute, Motion,
+    Material, MaterialBlock, Object3D, GMObject,
+)}
+MATH_TYPES = {cls.__name__: cls for cls in (Vector, Quaternion, Matrix)}
+
+
+def sidecar_path(filepath : str) -> str:
+    return filepath + SUFFIX
+
+
+def source_hash(filepath : str) -> str:
+    with open(filepath, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+class Encoder:
+    """Turns parsed objects into JSON compatible values, collecting arrays as blobs."""
+    def __init__(self):
+        self.blobs : list[tuple[int, np.ndarray]] = []
+        self.size = 0
+        self.bones = {}
+
+
+    def array(self, data : np.ndarray):
+        data = np.ascontiguousarray(data)
+        self.size += -self.size % ALIGNMENT
+        dtype = data.dtype.descr if data.dtype.names else data.dtype.str # records keep their fields
+        ref = {"__array__": [self.size, dtype, list(data.shape)]}
+        self.blobs.append((self.size, data))
+        self.size += data.nbytes
+        return ref
+
+
+    def encode(self, value):
+        if isinstance(value, (str, int, float, bool)) or value is None:
+            return value
+        if isinstance(value, np.ndarray):
+            return self.array(value)
+        if isinstance(value, (list, tuple)):
+            return [self.encode(v) for v in value]
+        if isinstance(value, tuple(MATH_TYPES.values())):
+            rows = [list(row) for row in value] if isinstance(value, Matrix) else list(value)
+            return {"__math__": type(value).__name__, "value": rows}
+        if isinstance(value, Bone) and id(value) in self.bones:
+            return {"__bone__": self.bones[id(value)]}
+        if type(value).__name__ in TYPES:
+            return self.encode_object(value)
+        raise TypeError(f"Cannot store {type(value).__name__} in a sidecar")
+
+
+    def encode_object(self, obj):
+        name = type(obj).__name__
+        state = {k: v for k, v in fields(obj).items() if k not in TRANSIENT.get(name, ())}
+        if isinstance(obj, GMObject):
+            for attr, dtype in GMO_ARRAYS.items():
+                if isinstance(state[attr], list) and len(state[attr]) > 0:
+                    state[attr] = np.array(state[attr], dtype=dtype)
+
+        encoded = {"__type__": name}
+        if isinstance(obj, Skeleton):
+            # Bones reference each other, children are stored as indices
+            self.bones = {id(bone): i for i, bone in enumerate(obj.bones)}
+            encoded["bones"] = [self.encode_object(bone) for bone in state.pop("bones")]
+
+        encoded.update((k, self.encode(v)) for k, v in state.items())
+        return encoded
+
+
+class Decoder:
+    """Rebuilds parsed objects from a description, arrays are views into buffer."""
+    def __init__(self, buffer, base : int):
+        self.buffer = buffer
+        self.base = base
+
+
+    def decode(self, value):
+        if isinstance(value, list):
+            return [self.decode(v) for v in value]
+        if not isinstance(value, dict):
+            return value
+        if "__array__" in value:
+            offset, dtype, shape = value["__array__"]
+            dtype = np.dtype([tuple(field) for field in dtype]) if isinstance(dtype, list) else np.dtype(dtype)
+            count = int(np.prod(shape, dtype=np.int64))
+            if count == 0:
+                return np.empty(shape, dtype)
+            return np.frombuffer(self.buffer, dtype, count, self.base + offset).reshape(shape)
+        if "__math__" in value:
+            return MATH_TYPES[value["__math__"]](value["value"])
+        if "__type__" in value:
+            obj = TYPES[value["__type__"]]()
+            for k, v in value.items():
+                if k != "__type__":
+                    setattr(obj, k, self.decode(v))
+            if isinstance(obj, Skeleton):
+                for bone in obj.bones:
+                    bone.children = [obj.bones[child["__bone__"]] for child in bone.children]
+            return obj
+        return {k: self.decode(v) for k, v in value.items()}
+
+
+def save(filepath : str, kind : str, parser_version : int, value):
+    """
+    Write the parsed value of filepath to its sidecar. Failures, like a read-only asset
+    directory, only mean the next import parses the file again.
+    """
+    encoder = Encoder()
+    description = json.dumps({
+        "kind": kind,
+        "source": source_hash(filepath),
+        "parser": parser_version,
+        "value": encoder.encode(value),
+    }, separators=(",", ":")).encode("utf-8")
+
+    base = HEADER_STRUCT.size + len(description)
+    base += -base % ALIGNMENT
+
+    path = sidecar_path(filepath)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(HEADER_STRUCT.pack(MAGIC, FORMAT_VERSION, len(description)))
+            f.write(description)
+            for offset, data in encoder.blobs:
+                f.seek(base + offset)
+                f.write(data.tobytes())
+        os.replace(temp_path, path)
+    except OSError as e:
+        print(f"Could not write cache {path}: {e}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def load(filepath : str, kind : str, parser_version : int):
+    """
+    Return the value stored in the sidecar of filepath, or None if there is no sidecar
+    or it was written for a different source file, parser or format version.
+    """
+    path = sidecar_path(filepath)
+    try:
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    try:
+        magic, version, length = HEADER_STRUCT.unpack_from(buffer, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            return None
+
+        description = json.loads(bytes(buffer[HEADER_STRUCT.size:HEADER_STRUCT.size + length]))
+        if description["kind"] != kind or description["parser"] != parser_version:
+            return None
+    except (struct.error, ValueError, KeyError):
+        return None
+    if description["source"] != source_hash(filepath):
+        return None
+
+    base = HEADER_STRUCT.size + length
+    base += -base % ALIGNMENT
+    return Decoder(buffer, base).decode(description["value"])
@@ -0,0 +1,187 @@
+"""
+Throughput benchmark of the O3D, CHR and ANI parsers on synthetic files.
+
+Runs in a plain Python interpreter with NumPy, bpy and mathutils are replaced by the
+stand-ins in stubs.py when Blender's modules are not available:
+
+    python benchmarks/bench_parsers.py [--output results.json] [--baseline old.json] [options]
+
+Every case is timed over several repeats after a warm-up run. MB/s, vertices/s and
+keyframes/s are computed from the median time. With --output, the results are also
+written as JSON so runs can be compared over time, --baseline prints the speedup of
+each case against such a file.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import numpy as np
+
+from stubs import install_stubs, import_addon
+
+STUBBED = install_stubs()
+import_addon()
+from io_o3d.importer import O3DFile, PARSER_VERSION
+import synthetic
+
+RESULTS_VERSION = 1
+IMPORT_SETTINGS = {"include_animations": False, "hide_lod": True, "hide_coll": True}
+
+
+def generate_files(directory : str, args) -> dict:
+    """Write the synthetic inputs, returning their path and counts by file name."""
+    files = {}
+    def add(name, write, **kwargs):
+        path = os.path.join(directory, name)
+        counts = write(path, **kwargs)
+        files[name] = dict(counts, path=path, bytes=os.path.getsize(path))
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        model = dict(vertex_count=args.vertices, mesh_count=args.meshes, lod_count=args.lods,
+                     material_count=args.materials)
+        add("static.o3d", synthetic.write_o3d, frame_count=args.frames, **model)
+        add("skinned.o3d", synthetic.write_o3d, skinned=True, **model)
+        add("skeleton.chr", synthetic.write_chr, bone_count=args.bones)
+        add("motion.ani", synthetic.write_ani, bone_count=args.bones, frame_count=args.frames)
+    return files
+
+
+def parse_o3d(path : str, use_mmap : bool, columnar : bool):
+    O3DFile(path, use_mmap, columnar).read_o3d(IMPORT_SETTINGS)
+
+
+def parse_chr(path : str, use_mmap : bool, columnar : bool):
+    O3DFile(path, use_mmap).parse_chr(path)
+
+
+def parse_ani(path : str, use_mmap : bool, columnar : bool):
+    O3DFile(path, use_mmap).parse_ani(path)
+
+
+def benchmark_cases(files : dict) -> list[tuple]:
+    """(case name, input file, parse function, use_mmap, columnar) of every case."""
+    cases = []
+    for name in ("static.o3d", "skinned.o3d"):
+        for columnar in (False, True):
+            for use_mmap in (False, True):
+                storage = "columnar" if columnar else "lists"
+                reader = "mmap" if use_mmap else "stream"
+                cases.append((f"{name}/{storage}/{reader}", name, parse_o3d, use_mmap, columnar))
+
+    for name, parse in (("skeleton.chr", parse_chr), ("motion.ani", parse_ani)):
+        for use_mmap in (False, True):
+            cases.append((f"{name}/{'mmap' if use_mmap else 'stream'}", name, parse, use_mmap, False))
+    return cases
+
+
+def time_case(parse, path : str, use_mmap : bool, columnar : bool, repeats : int) -> list[float]:
+    times = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        parse(path, use_mmap, columnar) # warm-up, fills the OS file cache
+        for _ in range(repeats):
+            start = time.perf_counter()
+            parse(path, use_mmap, columnar)
+            times.append(time.perf_counter() - start)
+    return times
+
+
+def run(args) -> dict:
+    with tempfile.TemporaryDirectory(prefix="o3d_bench_") as directory:
+        files = generate_files(args.keep or directory, args)
+
+        results = []
+        for case, name, parse, use_mmap, columnar in benchmark_cases(files):
+            if args.filter and args.filter not in case:
+                continue
+
+            file = files[name]
+            times = time_case(parse, file["path"], use_mmap, columnar, args.repeats)
+            median = statistics.median(times)
+            result = {
+                "case": case,
+                "mmap": use_mmap,
+                "columnar": columnar,
+                "bytes": file["bytes"],
+                "vertices": file.get("vertices", 0),
+                "keyframes": file.get("keyframes", 0),
+                "repeats": args.repeats,
+                "min_s": min(times),
+                "median_s": median,
+                "mb_per_s": file["bytes"] / median / 1e6,
+                "vertices_per_s": file.get("vertices", 0) / median,
+                "keyframes_per_s": file.get("keyframes", 0) / median,
+            }
+            results.append(result)
+            print(
+                f"{case:32} {result['median_s'] * 1000:9.2f} ms {result['mb_per_s']:9.1f} MB/s"
+                f" {result['vertices_per_s'] / 1e6:9.2f} Mvert/s {result['keyframes_per_s'] / 1e6:9.2f} Mkey/s"
+            )
+
+    return {
+        "version": RESULTS_VERSION,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "parser_version": PARSER_VERSION,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "stubbed": STUBBED,
+        "parameters": {
+            "vertices": args.vertices, "meshes": args.meshes, "lods": args.lods, "materials": args.materials,
+            "bones": args.bones, "frames": args.frames,
+        },
+        "results": results,
+    }
+
+
+def compare(report : dict, baseline_path : str):
+    """Print the median time speedup of every case also found in the baseline report."""
+    with open(baseline_path) as f:
+        baseline = {result["case"]: result for result in json.load(f)["results"]}
+
+    print(f"\nSpeedup against {baseline_path}:")
+    for result in report["results"]:
+        old = baseline.get(result["case"])
+        if old is not None:
+            print(f"{result['case']:32} {old['median_s'] / result['median_s']:6.2f}x")
+
+
+def parse_args(argv : list[str]):
+    parser = argparse.ArgumentParser(
+        prog="python benchmarks/bench_parsers.py",
+        description="Measure the throughput of the .o3d, .chr and .ani parsers on synthetic files",
+    )
+    parser.add_argument("--vertices", type=int, default=20000, help="Vertices per mesh of the first level of detail")
+    parser.add_argument("--meshes", type=int, default=4, help="Meshes per level of detail")
+    parser.add_argument("--lods", type=int, choices=(1, 3), default=3, help="Levels of detail")
+    parser.add_argument("--materials", type=int, default=2, help="Materials per mesh")
+    parser.add_argument("--bones", type=int, default=60, help="Bones of the skeleton and animation")
+    parser.add_argument("--frames", type=int, default=120, help="Frames of the animation and the static model")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed runs per case")
+    parser.add_argument("--filter", help="Only run cases whose name contains this text")
+    parser.add_argument("--keep", metavar="DIR", help="Write the synthetic files to this directory and keep them")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="Results JSON of an earlier run to compare against")
+    return parser.parse_args(argv)
+
+
+def main(argv : list[str]) -> int:
+    args = parse_args(argv)
+    if args.keep:
+        os.makedirs(args.keep, exist_ok=True)
+
+    report = run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        compare(report, args.baseline)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,63 @@
+"""
+Minimal stand-ins for Blender's bpy and mathutils modules, enough to import and run
+the addon's parsers in a plain Python interpreter. The parsers only construct vectors,
+quaternions and matrices, they never compute with them, so no math is implemented.
+"""
+import os
+import sys
+import types
+
+ADDONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "addons")
+
+
+class Vector(tuple):
+    def __new__(cls, values=(0, 0, 0)):
+        return super().__new__(cls, values)
+
+
+class Quaternion(tuple):
+    def __new__(cls, values=(1, 0, 0, 0)):
+        return super().__new__(cls, values)
+
+
+class Matrix(tuple):
+    def __new__(cls, rows=()):
+        return super().__new__(cls, (tuple(row) for row in rows))
+
+    @classmethod
+    def Identity(cls, size):
+        return cls([[1 if i == j else 0 for j in range(size)] for i in range(size)])
+
+
+def install_stubs() -> bool:
+    """Register the stand-ins unless Blender's modules can be imported. Returns whether they were."""
+    try:
+        import bpy, mathutils
+        return False
+    except ImportError:
+        pass
+
+    mathutils = types.ModuleType("mathutils")
+    mathutils.Vector = Vector
+    mathutils.Quaternion = Quaternion
+    mathutils.Matrix = Matrix
+
+    bpy = types.ModuleType("bpy")
+    bpy.types = types.ModuleType("bpy.types")
+    bpy.types.Object = type("Object", (), {})
+    bpy.types.EditBone = type("EditBone", (), {})
+
+    sys.modules.update({"mathutils": mathutils, "bpy": bpy, "bpy.types": bpy.types})
+    return True
+
+
+def import_addon():
+    """
+    Import the io_o3d package without running its __init__, which registers operators
+    and needs the full Blender API. Submodules like io_o3d.importer import normally.
+    """
+    if "io_o3d" not in sys.modules:
+        package = types.ModuleType("io_o3d")
+        package.__path__ = [os.path.join(ADDONS_DIR, "io_o3d")]
+        sys.modules["io_o3d"] = package
+    return sys.modules["io_o3d"]
@@ -0,0 +1,198 @@
+"""
+Generators of synthetic .o3d models, .chr skeletons and .ani animations in the layouts
+read by O3DFile.read_o3d, parse_chr and parse_ani. The content is random but seeded,
+the same arguments always produce the same file.
+"""
+import numpy as np
+from stubs import install_stubs, import_addon
+
+install_stubs()
+import_addon()
+from io_o3d.o3d_types import *
+from io_o3d.exporter import BinaryWriter, O3DWriter
+
+IDENTITY = (1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1)
+
+
+def random_quats(rng : np.random.Generator, count : int) -> np.ndarray:
+    quats = rng.normal(size=(count, 4)).astype(np.float32)
+    return quats / np.linalg.norm(quats, axis=1, keepdims=True)
+
+
+def random_frames(rng : np.random.Generator, count : int) -> np.ndarray:
+    """(count, 7) keys of random rotations and positions."""
+    return np.hstack((random_quats(rng, count), rng.random((count, 3), dtype=np.float32)))
+
+
+def random_transform(rng : np.random.Generator) -> tuple:
+    """Rotation about the up axis followed by a translation, as a row-major matrix."""
+    angle = rng.uniform(-np.pi, np.pi)
+    c, s = np.cos(angle), np.sin(angle)
+    x, y, z = rng.random(3)
+    return (c, 0, -s, 0, 0, 1, 0, 0, s, 0, c, 0, x, y, z, 1)
+
+
+def synthetic_gmobject(rng : np.random.Generator, vertex_count : int, skinned : bool = False,
+                       material_count : int = 1, bone_count : int = MAX_USED_BONES,
+                       frame_count : int = 0) -> GMObject:
+    """A GMObject with random geometry split into one material block per material."""
+    if not 3 <= vertex_count <= MAX_VERTICES:
+        raise ValueError(f"vertex_count must be between 3 and {MAX_VERTICES}")
+
+    gmo = GMObject()
+    gmo.gm_type = 1 if skinned else 0
+    gmo.parent_id = -1
+    gmo.transform = IDENTITY
+    gmo.bbmin = (-1, -1, -1)
+    gmo.bbmax = (1, 1, 1)
+
+    # Vertices are split on UV seams, so there are fewer distinct positions
+    list_count = vertex_count // 2 + 1
+    gmo.vertex_list = rng.uniform(-1, 1, (list_count, 3)).astype(np.float32)
+    gmo.IIB = (np.arange(vertex_count) % list_count).astype(np.uint16)
+    gmo.vertices = gmo.vertex_list[gmo.IIB]
+
+    normals = rng.normal(size=(vertex_count, 3)).astype(np.float32)
+    gmo.normals = normals / np.linalg.norm(normals, axis=1, keepdims=True)
+    gmo.uvs = rng.random((vertex_count, 2), dtype=np.float32)
+    gmo.indices = rng.integers(0, vertex_count, (vertex_count, 3), dtype=np.uint16)
+
+    palette = list(range(min(bone_count, MAX_USED_BONES)))
+    if skinned:
+        weights = rng.random(vertex_count, dtype=np.float32)
+        gmo.weights = np.stack([weights, 1 - weights], axis=1)
+        gmo.bone_ids = (rng.integers(0, len(palette), (vertex_count, 2)) * 3).astype(np.uint16) # palette offsets
+        gmo.used_bones = palette
+
+    face_count = len(gmo.indices)
+    bounds = np.linspace(0, face_count, material_count + 1).astype(int)
+    for i in range(material_count):
+        mat = Material()
+        mat.texture_name = f"synthetic{i:02d}.dds"
+        mat.power = 0.5
+        gmo.materials.append(mat)
+
+        block = MaterialBlock()
+        block.start_vertex = int(bounds[i]) * 3
+        block.primitive_count = int(bounds[i + 1] - bounds[i])
+        block.material_id = i
+        if skinned:
+            block.used_bones = palette
+            block.used_bone_count = len(palette)
+        gmo.material_blocks.append(block)
+
+    if not skinned and frame_count > 0:
+        gmo.frames = random_frames(rng, frame_count)
+    return gmo
+
+
+def write_o3d(filepath : str, vertex_count : int = 10000, mesh_count : int = 1, lod_count : int = 1,
+              material_count : int = 1, skinned : bool = False, frame_count : int = 0,
+              collision : bool = True, seed : int = 0) -> dict:
+    """
+    Write a model with mesh_count meshes per level of detail. Each level has half the
+    vertices of the one before. lod_count is 1 or 3, the only counts the format knows.
+    Returns the vertex and keyframe counts the parser will read.
+    """
+    if lod_count not in (1, 3):
+        raise ValueError("lod_count must be 1 or 3")
+
+    rng = np.random.default_rng(seed)
+    o3d = Object3D()
+    o3d.oid = seed
+    o3d.forces = [(0, 0, 0)] * 4
+    o3d.bbmin = (-1, -1, -1)
+    o3d.bbmax = (1, 1, 1)
+    o3d.perslerp = 0.5
+    o3d.frame_count = 0 if skinned else frame_count
+    o3d.lod = lod_count == 3
+
+    gmobjects = []
+    if collision:
+        coll_obj = synthetic_gmobject(rng, 24)
+        coll_obj.is_collision = True
+        gmobjects.append(coll_obj)
+
+    for lod in range(lod_count):
+        for i in range(mesh_count):
+            gmo = synthetic_gmobject(rng, max(vertex_count >> lod, 3), skinned, material_count,
+                                     frame_count=o3d.frame_count)
+            gmo.lod_index = lod
+            gmo.oid = i
+            gmo.transform = random_transform(rng)
+            gmobjects.append(gmo)
+
+    O3DWriter(filepath).write_o3d(o3d, gmobjects)
+    return {
+        "vertices": sum(len(gmo.vertices) for gmo in gmobjects),
+        "keyframes": sum(len(gmo.frames) for gmo in gmobjects),
+    }
+
+
+def synthetic_bones(rng : np.random.Generator, bone_count : int) -> list[Bone]:
+    bones = []
+    for i in range(bone_count):
+        bone = Bone()
+        bone.name = f"Bip01 B{i:03d}"
+        bone.parent_id = -1 if i == 0 else int(rng.integers(0, i))
+        bone.transform = bone.inverse_transform = bone.local_transform = random_transform(rng)
+        bones.append(bone)
+    return bones
+
+
+def write_chr(filepath : str, bone_count : int = 60, seed : int = 0) -> dict:
+    """Write a version 7 skeleton. Returns its bone count."""
+    rng = np.random.default_rng(seed)
+    writer = BinaryWriter(open(filepath, "wb"))
+    writer.write_int32(7) # version
+    writer.write_int32(seed)
+    writer.write_int32(bone_count)
+    for bone in synthetic_bones(rng, bone_count):
+        name = bone.name.encode("utf-8")
+        writer.write_int32(len(name) + 1)
+        writer.write_string(bone.name, len(name) + 1)
+        writer.write_transform(bone.transform)
+        writer.write_transform(bone.inverse_transform)
+        writer.write_transform(bone.local_transform)
+        writer.write_int32(bone.parent_id)
+
+    writer.write_int32(0) # send_VS
+    writer.write_transform(IDENTITY) # right hand
+    writer.write_transform(IDENTITY) # shield
+    writer.write_transform(IDENTITY) # knuckle
+    for _ in range(8):
+        writer.write_vec3((0, 0, 0))
+        writer.write_int32(-1)
+    writer.write_transform(IDENTITY) # left hand
+    writer.close()
+    return {"bones": bone_count}
+
+
+def write_ani(filepath : str, bone_count : int = 60, frame_count : int = 120, seed : int = 0) -> dict:
+    """Write a version 10 animation with every bone keyed on every frame. Returns its keyframe count."""
+    rng = np.random.default_rng(seed)
+    motion = Motion()
+    motion.bones = synthetic_bones(rng, bone_count)
+    for _ in range(bone_count):
+        bone_frame = BoneFrame()
+        bone_frame.frames = random_frames(rng, frame_count)
+        motion.frames.append(bone_frame)
+
+    writer = BinaryWriter(open(filepath, "wb"))
+    writer.write_int32(10) # version
+    writer.write_int32(seed)
+    writer.write_float(0.5) # perslerp
+    writer.write_zeros(32)
+    writer.write_int32(bone_count)
+    writer.write_int32(frame_count)
+    writer.write_int32(0) # no paths
+
+    O3DWriter(filepath).write_TMAnimation(writer, motion)
+
+    for frame in range(frame_count):
+        writer.write_uint16(0) # type
+        writer.write_int32(0) # sound id
+        writer.write_float(frame)
+    writer.write_int32(0) # events
+    writer.close()
+    return {"keyframes": bone_count * frame_count}